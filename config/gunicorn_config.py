@@ -0,0 +1,25 @@
+# coding: utf-8
+# gunicorn -c config/gunicorn_config.py seabattle.api:app
+#
+# The app, the mmapped ngram model and shot phrases are loaded once in the master, workers
+# are forked from it and share the pages copy-on-write. The NLU model is not fork-safe
+# (TensorFlow), every worker loads it after fork.
+
+import os
+
+from seabattle import startup
+
+bind = '[::]:%s' % os.environ.get('PORT', 5000)
+# sessions live in the worker memory, more workers need requests of a user to stick to one
+workers = int(os.environ.get('SEABATTLE_WORKERS', 1))
+threads = int(os.environ.get('SEABATTLE_THREADS', 4))
+preload_app = True
+
+
+def on_starting(server):
+    startup.preload()
+    startup.freeze()
+
+
+def post_fork(server, worker):
+    startup.warmup()
@@ -0,0 +1,238 @@
+# coding: utf-8
+
+import argparse
+import collections
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from seabattle import metrics
+
+
+log = logging.getLogger(__name__)
+
+# append-only log of finished games, empty turns analytics off
+ANALYTICS_PATH = os.environ.get('SEABATTLE_ANALYTICS_PATH', '')
+QUEUE_SIZE = int(os.environ.get('SEABATTLE_ANALYTICS_QUEUE', 10000))
+STATE_PATH = 'analytics_state.json'
+WINDOW = 1000
+
+STAGES = ('nlu', 'game', 'total')
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def new_game_stats():
+    return {
+        'started': time.time(),
+        'shots': 0,
+        'enemy_shots': 0,
+        'turns': 0,
+        'nlu_fallbacks': 0,
+        'dontunderstand': 0,
+        'stages': {stage: 0.0 for stage in STAGES},
+    }
+
+
+def summarize(stats, result, size=None, opponent=None):
+    """A finished game summary from the stats collected by DialogManager."""
+    summary = dict(stats)
+    summary['stages'] = dict(stats['stages'])
+    summary.update({
+        'finished': time.time(),
+        'duration': time.time() - stats['started'],
+        'result': result,
+        'size': size,
+        'opponent': opponent,
+    })
+    return summary
+
+
+class Writer(object):
+    """
+    Appends summaries to `path` as JSON lines from a background thread. `submit` never
+    blocks: when the queue is full the summary is dropped and counted in metrics.
+    """
+
+    def __init__(self, path, max_size=QUEUE_SIZE):
+        self.path = path
+        self._queue = queue.Queue(max_size)
+        self._thread = threading.Thread(target=self._run, name='analytics-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, summary):
+        try:
+            self._queue.put_nowait(summary)
+        except queue.Full:
+            metrics.incr('analytics_dropped')
+
+    def join(self):
+        self._queue.join()
+
+    def _write(self, summaries):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for summary in summaries:
+                f.write(json.dumps(summary, ensure_ascii=False, sort_keys=True) + '\n')
+
+    def _run(self):
+        while True:
+            # everything queued meanwhile goes in with one write
+            summaries = [self._queue.get()]
+            while True:
+                try:
+                    summaries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._write(summaries)
+            except Exception:
+                log.exception('Can\'t write %d game summaries to %s', len(summaries), self.path)
+                metrics.incr('analytics_dropped', len(summaries))
+            finally:
+                for _ in summaries:
+                    self._queue.task_done()
+
+
+def get_writer():
+    global _writer
+    if _writer is None and ANALYTICS_PATH:
+        with _writer_lock:
+            if _writer is None:
+                _writer = Writer(ANALYTICS_PATH)
+    return _writer
+
+
+def record(summary):
+    writer = get_writer()
+    if writer is not None:
+        writer.submit(summary)
+
+
+class Aggregator(object):
+    """
+    Rolling statistics over the games log. Only lines appended since the last `update()`
+    are read: the byte offset is kept in the state together with the totals and the
+    last `window` games, so the state can be saved and the aggregation resumed later.
+    """
+
+    def __init__(self, path, state=None, window=WINDOW):
+        self.path = path
+        self.window = window
+        state = state or {}
+        self.offset = state.get('offset', 0)
+        self.totals = state.get('totals') or {
+            'games': 0, 'results': {}, 'shots': 0, 'turns': 0, 'nlu_fallbacks': 0,
+            'dontunderstand': 0, 'duration': 0.0, 'stages': {stage: 0.0 for stage in STAGES},
+        }
+        self.recent = collections.deque(state.get('recent', []), maxlen=window)
+
+    @classmethod
+    def load(cls, path, state_path, window=WINDOW):
+        try:
+            with open(state_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        return cls(path, state, window)
+
+    def state(self):
+        return {'offset': self.offset, 'totals': self.totals, 'recent': list(self.recent)}
+
+    def save(self, state_path):
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state(), f)
+        os.replace(tmp_path, state_path)
+
+    def add(self, summary):
+        totals = self.totals
+        totals['games'] += 1
+        totals['results'][summary['result']] = totals['results'].get(summary['result'], 0) + 1
+        for key in ('shots', 'turns', 'nlu_fallbacks', 'dontunderstand', 'duration'):
+            totals[key] += summary.get(key, 0)
+        for stage, seconds in summary.get('stages', {}).items():
+            totals['stages'][stage] = totals['stages'].get(stage, 0.0) + seconds
+
+        self.recent.append({
+            'result': summary['result'],
+            'shots': summary.get('shots', 0),
+            'turns': summary.get('turns', 0),
+            'nlu_fallbacks': summary.get('nlu_fallbacks', 0),
+        })
+
+    def update(self):
+        """Read games appended since the last call, returns how many."""
+        try:
+            f = open(self.path, 'rb')
+        except OSError:
+            return 0
+
+        added = 0
+        with f:
+            f.seek(self.offset)
+            for line in f:
+                # the writer may be in the middle of a line
+                if not line.endswith(b'\n'):
+                    break
+                self.offset += len(line)
+                try:
+                    summary = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    log.warning('Skipping broken game summary at %d', self.offset - len(line))
+                    continue
+                self.add(summary)
+                added += 1
+        return added
+
+    def report(self):
+        totals = self.totals
+        games = totals['games']
+        recent = list(self.recent)
+
+        def _mean(values):
+            return sum(values) / len(values) if values else 0.0
+
+        return {
+            'games': games,
+            'win_rate': totals['results'].get('victory', 0) / games if games else 0.0,
+            'mean_shots': totals['shots'] / games if games else 0.0,
+            'mean_turns': totals['turns'] / games if games else 0.0,
+            'nlu_fallbacks_per_turn': totals['nlu_fallbacks'] / totals['turns'] if totals['turns'] else 0.0,
+            'mean_stage_seconds': {stage: seconds / games if games else 0.0
+                                   for stage, seconds in totals['stages'].items()},
+            'recent': {
+                'games': len(recent),
+                'win_rate': _mean([g['result'] == 'victory' for g in recent]),
+                'mean_shots': _mean([g['shots'] for g in recent]),
+                'mean_turns': _mean([g['turns'] for g in recent]),
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Update rolling statistics with games finished since the last run')
+    parser.add_argument('--log', default=ANALYTICS_PATH or 'analytics/games.jsonl')
+    parser.add_argument('--state', help='where the aggregation state is kept, next to the log by default')
+    parser.add_argument('--window', type=int, default=WINDOW, help='games in the recent statistics')
+    args = parser.parse_args()
+
+    state_path = args.state or os.path.join(os.path.dirname(args.log), STATE_PATH)
+    aggregator = Aggregator.load(args.log, state_path, args.window)
+    added = aggregator.update()
+    aggregator.save(state_path)
+
+    print('New games: %d' % added)
+    print(json.dumps(aggregator.report(), indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,18 @@
 # coding: utf-8
 
-from __future__ import unicode_literals
-
 import json
 import logging
-import sys
+import os
+import re
+import threading
+import time
 
 from flask import Flask, request
 
 from seabattle import dialog_manager as dm
+from seabattle import idempotency
+from seabattle import metrics
+from seabattle import profiling
 from seabattle import session
 
 
@@ -17,32 +21,139 @@ logging.basicConfig(level=logging.DEBUG)
 app = Flask(__name__)
 log = logging.getLogger(__name__)
 
+# time to answer a request, with a margin to the Dialogs timeout
+DEADLINE = float(os.environ.get('SEABATTLE_DEADLINE_MS', 1500)) / 1000
+# requests processed at once, the rest are answered with a cheap "repeat"
+MAX_IN_FLIGHT = int(os.environ.get('SEABATTLE_MAX_IN_FLIGHT', 32))
+# value of the X-Seabattle-Metrics header /metrics requires, empty hides it
+METRICS_SECRET = os.environ.get('SEABATTLE_METRICS_SECRET', '')
+
+# Dialogs resend a request when we are slow, it must not be handled twice
+coalescer = idempotency.RequestCoalescer()
+_slots = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def parse_envelope(body):
+    """
+    Decode members of the top level JSON object in `body`, keeping the raw JSON text of
+    every value, so parts of the request can be echoed back without encoding them again.
+
+    Returns {key: (value, raw_json)}.
+    """
+    members = {}
+    idx = _whitespace.match(body).end()
+    if body[idx:idx + 1] != '{':
+        raise ValueError('Expecting object at %d' % idx)
+
+    idx = _whitespace.match(body, idx + 1).end()
+    if body[idx:idx + 1] == '}':
+        return members
+
+    while True:
+        if body[idx:idx + 1] != '"':
+            raise ValueError('Expecting property name at %d' % idx)
+        key, idx = json.decoder.scanstring(body, idx + 1)
+
+        idx = _whitespace.match(body, idx).end()
+        if body[idx:idx + 1] != ':':
+            raise ValueError('Expecting \':\' at %d' % idx)
+        idx = _whitespace.match(body, idx + 1).end()
+
+        value, end = _decoder.raw_decode(body, idx)
+        members[key] = (value, body[idx:end])
+
+        idx = _whitespace.match(body, end).end()
+        if body[idx:idx + 1] == '}':
+            return members
+        elif body[idx:idx + 1] != ',':
+            raise ValueError('Expecting \',\' or \'}\' at %d' % idx)
+        idx = _whitespace.match(body, idx + 1).end()
+
+
+Overloaded = idempotency.Overloaded
+
+
+def render_response(envelope, response):
+    return '{"version": %s, "session": %s, "response": %s}' % (
+        envelope['version'][1],
+        envelope['session'][1],
+        json.dumps(response),
+    )
+
+
+def render_shed_response(envelope):
+    metrics.incr('shed_requests')
+    return render_response(envelope, {
+        'text': dm.MESSAGE_TEMPLATES['dontunderstand'],
+        'end_session': False,
+    })
+
 
 @app.route('/', methods=['POST'])
 def main():
-    log.info('Request: %r', request.json)
+    deadline = time.monotonic() + DEADLINE
+    body = request.get_data(as_text=True)
+    log.info('Request: %s', body)
 
-    response = {
-        'version': request.json['version'],
-        'session': request.json['session'],
-    }
-    json_body = request.json
+    try:
+        envelope = parse_envelope(body)
+        session_json = envelope['session'][0]
+        key = (session_json['session_id'], session_json['message_id'])
+    except (ValueError, KeyError, TypeError) as e:
+        log.warning('Bad request: %s', e)
+        metrics.incr('bad_requests')
+        return 'Bad request', 400
+
+    if not _slots.acquire(blocking=False):
+        rendered = render_shed_response(envelope)
+    else:
+        try:
+            with profiling.Profiler('request', enabled=profiling.header_allows(request.headers.get('X-Seabattle-Profile'))):
+                rendered = coalescer.run(key, lambda: handle(envelope, deadline), deadline)
+        except Overloaded:
+            rendered = render_shed_response(envelope)
+        finally:
+            _slots.release()
+
+    log.info('Response: %s', rendered)
+    return rendered
 
-    user_id = json_body['session']['user_id']
-    session_obj = session.get(user_id)
-    dm_obj = dm.DialogManager(session_obj)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_view():
+    # the webhook host is public, so are its other routes
+    if not profiling.header_allows(request.headers.get('X-Seabattle-Metrics'), METRICS_SECRET):
+        return 'Not found', 404
+    return json.dumps(metrics.snapshot())
+
+
+def _check_deadline(deadline):
+    if deadline is not None and time.monotonic() >= deadline:
+        # raised rather than answered, so the shed reply is not cached for the retry
+        raise Overloaded()
+
+
+def handle(envelope, deadline=None):
+    _check_deadline(deadline)
+
+    json_body = {key: value for key, (value, _) in envelope.items()}
 
     message = json_body['request']['command'].strip()
     if not message:
         message = json_body['request']['original_utterance']
 
-    dmresponse = dm_obj.handle_message(message)
-    response['response'] = {
+    with session.locked(json_body['session']['user_id']) as session_obj:
+        # another request of the user may have held the session until the deadline
+        _check_deadline(deadline)
+        dm_obj = dm.DialogManager(session_obj)
+        dmresponse = dm_obj.handle_message(message, deadline)
+    response = {
         'text': dmresponse.text,
         'end_session': dmresponse.end_session,
     }
     if dmresponse.tts is not None:
-        response['response']['tts'] = dmresponse.tts
+        response['tts'] = dmresponse.tts
 
-    log.info('Response: %r', response)
-    return json.dumps(response)
+    return render_response(envelope, response)
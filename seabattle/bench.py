@@ -0,0 +1,86 @@
+# coding: utf-8
+
+import argparse
+import logging
+import random
+import time
+
+from seabattle import game as gm
+from seabattle import simulate
+from seabattle import stats
+
+
+def scaled_fleet(size):
+    """Default fleet repeated to cover the same share of a `size`x`size` board."""
+    return gm.BaseGame.default_ships * max(1, size ** 2 // 100)
+
+
+def play_out(game_cls, size, ships, layouts=''):
+    """
+    Sink a random field with `game_cls`, returns (field generation seconds, shot seconds).
+    The field is uniformly random, or from the pool in `layouts` if it is given.
+    """
+    started = time.perf_counter()
+    target = gm.Game()
+    target.start_new_game(size, ships=ships, layouts=layouts)
+    field_time = time.perf_counter() - started
+
+    shooter = game_cls()
+    shooter.start_new_game(size, [gm.EMPTY] * size ** 2, ships, numbers=True)
+
+    shot_times = []
+    max_shots = 2 * size ** 2
+    while not target.is_defeat() and len(shot_times) < max_shots:
+        started = time.perf_counter()
+        coords = shooter.convert_to_position(simulate.prepare_text_coords(shooter.do_shot()))
+        reply = target.handle_enemy_shot(coords)
+        shooter.handle_enemy_reply(reply)
+        shot_times.append(time.perf_counter() - started)
+
+    return field_time, shot_times
+
+
+def run(sizes, games=3, game_cls=gm.Game, seed=0, layouts=''):
+    results = []
+    for size in sizes:
+        random.seed(seed)
+        ships = scaled_fleet(size)
+        field_times = []
+        shot_times = []
+        for _ in range(games):
+            field_time, times = play_out(game_cls, size, ships, layouts)
+            field_times.append(field_time)
+            shot_times.extend(times)
+
+        results.append({
+            'size': size,
+            'ships': len(ships),
+            'field_ms': sum(field_times) / len(field_times) * 1000,
+            'shots_per_game': len(shot_times) / games,
+            'shot_mean_us': sum(shot_times) / len(shot_times) * 1e6,
+            'shot_p95_us': stats.percentile(shot_times, 0.95) * 1e6,
+            'shot_max_us': max(shot_times) * 1e6,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure field generation and shot time on growing boards')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 20, 50, 100])
+    parser.add_argument('--games', type=int, default=3)
+    parser.add_argument('--game', default='seabattle.game', help='strategy or module with the Game implementation')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--layouts', default='', metavar='PATH',
+                        help='draw fields from this pool of seabattle.layouts, uniformly random by default')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    print('%6s %6s %10s %8s %12s %12s %12s' % ('size', 'ships', 'field ms', 'shots', 'shot us', 'p95 us', 'max us'))
+    for r in run(args.sizes, args.games, simulate.load_game_class(args.game), args.seed, args.layouts):
+        print('%(size)6d %(ships)6d %(field_ms)10.1f %(shots_per_game)8.0f '
+              '%(shot_mean_us)12.1f %(shot_p95_us)12.1f %(shot_max_us)12.1f' % r)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,201 @@
 # coding: utf-8
 
-from __future__ import unicode_literals
-
+import argparse
+import collections
 import logging
 import os
-
-from telegram import ext as telegram_ext
+import queue
+import threading
+import time
 
 from seabattle import dialog_manager as dm
 from seabattle import session
 
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG
-)
 logger = logging.getLogger(__name__)
 
+WORKERS = int(os.environ.get('SEABATTLE_BOT_WORKERS', 8))
+SENDERS = int(os.environ.get('SEABATTLE_BOT_SENDERS', 4))
+SEND_QUEUE_SIZE = int(os.environ.get('SEABATTLE_BOT_SEND_QUEUE', 1000))
+
+
+class Sender(object):
+    """
+    Sends replies from background threads through bounded queues, so slow Telegram calls
+    don't hold the workers. Every chat is pinned to one sending thread to keep its replies
+    in order. A full queue blocks the workers until it drains.
+    """
+
+    def __init__(self, bot, max_size=SEND_QUEUE_SIZE, threads=SENDERS):
+        self.bot = bot
+        self._queues = [queue.Queue(max(1, max_size // threads)) for _ in range(threads)]
+        for i, q in enumerate(self._queues):
+            thread = threading.Thread(target=self._run, args=(q,), name='bot-sender-%d' % i)
+            thread.daemon = True
+            thread.start()
+
+    def send(self, chat_id, text):
+        self._queues[hash(chat_id) % len(self._queues)].put((chat_id, text))
+
+    def join(self):
+        for q in self._queues:
+            q.join()
+
+    def _run(self, q):
+        while True:
+            chat_id, text = q.get()
+            try:
+                self.bot.send_message(chat_id=chat_id, text=text)
+            except Exception:
+                logger.exception('Can\'t send message to chat %s', chat_id)
+            finally:
+                q.task_done()
+
+
+class ChatWorkers(object):
+    """
+    Handles updates on a pool of threads. Every chat is pinned to one worker, so messages
+    of a chat are handled in order while different chats proceed in parallel.
+    """
+
+    def __init__(self, handler, workers=WORKERS):
+        self.handler = handler
+        self._queues = [queue.Queue() for _ in range(workers)]
+        for i, q in enumerate(self._queues):
+            thread = threading.Thread(target=self._run, args=(q,), name='bot-worker-%d' % i)
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, update):
+        self._queues[hash(update.message.chat_id) % len(self._queues)].put(update)
+
+    def join(self):
+        for q in self._queues:
+            q.join()
+
+    def _run(self, q):
+        while True:
+            update = q.get()
+            try:
+                self.handler(update)
+            except Exception:
+                logger.exception('Update "%s" caused error', update)
+            finally:
+                q.task_done()
+
+
+class Bot(object):
+    def __init__(self, telegram_bot, workers=WORKERS, senders=SENDERS, send_queue_size=SEND_QUEUE_SIZE):
+        self.sender = Sender(telegram_bot, send_queue_size, senders)
+        self.workers = ChatWorkers(self.handle_update, workers)
+
+    def handle_update(self, update):
+        with session.locked(update.message.chat_id) as session_obj:
+            dm_obj = dm.DialogManager(session_obj)
+            dmresponse = dm_obj.handle_message(update.message.text)
+        self.sender.send(update.message.chat_id, dmresponse.text)
+
+    def bot_handler(self, bot, update):
+        self.workers.submit(update)
 
-def bot_handler(bot, update):
-    session_obj = session.get(update.message.chat_id)
-    dm_obj = dm.DialogManager(session_obj)
-    dmresponse = dm_obj.handle_message(update.message.text)
-    bot.send_message(chat_id=update.message.chat_id, text=dmresponse.text)
+    def join(self):
+        self.workers.join()
+        self.sender.join()
 
 
 def error_handler(bot, update, error):
-    logger.error('Update "{0}" caused error "{1}"', update, error)
+    logger.error('Update "%s" caused error "%s"', update, error)
+
+
+FakeMessage = collections.namedtuple('FakeMessage', ['chat_id', 'text'])
+FakeUpdate = collections.namedtuple('FakeUpdate', ['message'])
+
+
+class FakeTelegramBot(object):
+    """Offline stand-in for telegram.Bot which records replies, optionally with network latency."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.sent[chat_id].append((time.monotonic(), text))
+
+
+LOAD_TEST_SCRIPT = [
+    'новая игра',
+    'начинай',
+    'мимо. я хожу 1 1',
+    'ранил',
+    'убил',
+    'я не поняла',
+    'мимо. я хожу 5 5',
+    'ура победа',
+]
+
+
+def load_test(chats=100, workers=WORKERS, senders=SENDERS, latency=0.05, script=None):
+    """Play `script` in `chats` chats at once against the fake Telegram API and measure reply latency."""
+    script = script or LOAD_TEST_SCRIPT
+    telegram_bot = FakeTelegramBot(latency)
+    bot = Bot(telegram_bot, workers, senders)
+    submitted = collections.defaultdict(list)
+
+    started = time.monotonic()
+    for text in script:
+        for chat_id in range(chats):
+            submitted['load-test-%d' % chat_id].append(time.monotonic())
+            bot.bot_handler(telegram_bot, FakeUpdate(FakeMessage('load-test-%d' % chat_id, text)))
+    bot.join()
+    elapsed = time.monotonic() - started
+
+    latencies = sorted(sent_at - submitted_at
+                       for chat_id, times in submitted.items()
+                       for submitted_at, (sent_at, _) in zip(times, telegram_bot.sent[chat_id]))
+    return {
+        'messages': len(latencies),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed,
+        'p50': latencies[len(latencies) // 2],
+        'p95': latencies[int(len(latencies) * 0.95)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Telegram bot for the skill')
+    parser.add_argument('--offline', action='store_true', help='load test against a fake Telegram API')
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--senders', type=int, default=SENDERS)
+    parser.add_argument('--latency', type=float, default=0.05, help='fake send_message latency, seconds')
+    args = parser.parse_args()
+
+    if args.offline:
+        logging.basicConfig(level=logging.WARNING)
+        result = load_test(args.chats, args.workers, args.senders, args.latency)
+        print('{messages} messages in {seconds:.2f}s, {throughput:.1f} msg/s, '
+              'latency p50 {p50:.3f}s, p95 {p95:.3f}s'.format(**result))
+        return
+
+    from telegram import ext as telegram_ext
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.DEBUG
+    )
+
+    updater = telegram_ext.Updater(token=os.environ.get('TELEGRAM_TOKEN'))
+    bot = Bot(updater.bot, args.workers, args.senders)
+    dispatcher = updater.dispatcher
+    dispatcher.add_handler(telegram_ext.MessageHandler(telegram_ext.Filters.text, bot.bot_handler))
+    dispatcher.add_error_handler(error_handler)
+    updater.start_polling()
+    updater.idle()
 
 
-updater = telegram_ext.Updater(token=os.environ.get('TELEGRAM_TOKEN'))
-dispatcher = updater.dispatcher
-dispatcher.add_handler(telegram_ext.MessageHandler(telegram_ext.Filters.text, bot_handler))
-updater.start_polling()
-updater.idle()
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,28 @@
 # coding: utf-8
 
-from __future__ import unicode_literals
-
 import collections
+import functools
 import json
 import logging
+import threading
+import time
 
-from rasa_nlu.data_router import DataRouter
-
-from seabattle import game
+from seabattle import analytics
+from seabattle import game as gm
+from seabattle import metrics
+from seabattle import nlu
+from seabattle import phrases
+from seabattle import profiling
+from seabattle import session
 
 
 log = logging.getLogger(__name__)
-router = DataRouter('mldata/')
+# loaded on first use, so importing the module stays cheap, see seabattle.startup
+nlu_backend = None
+_nlu_lock = threading.Lock()
+_fallback_backend = None
+# the full NLU runs only if its usual parse time leaves this much before the deadline
+DEADLINE_RESERVE = 0.05
 MESSAGE_TEMPLATES = {
     'miss': 'Мимо. Я хожу %(shot)s',
     'hit': 'Ты попала',
@@ -22,13 +32,19 @@ MESSAGE_TEMPLATES = {
     'defeat': 'Я проиграла',
     'victory': 'Ура, победа!',
     'need_init': 'Пожалуйста, инициализируй новую игру и укажи соперника',
-    'dontunderstand': 'Не поняла. Повтори последний ход'
+    'dontunderstand': 'Не поняла. Повтори последний ход',
+    'resumegame': 'Продолжаем игру с %(opponent)s',
+    'nogame': 'У нас нет игры с %(opponent)s',
 }
 TTS_TEMPLATES = {
     'newgame': 'Инициализирована новая игра с - - %(opponent)s',
+    'resumegame': 'Продолжаем игру с - - %(opponent)s',
     'miss': 'Мимо - Я хожу - %(tts_shot)s',
     'shot': 'Я хожу - %(tts_shot)s',
 }
+SHOT_TEMPLATE_KEYS = ('miss', 'shot')
+# replies which are not a move, so "repeat" must still repeat the move before them
+NOT_SAVED_KEYS = ('dontunderstand', 'resumegame', 'nogame')
 DMResponse = collections.namedtuple('DMResponse', ['key', 'text', 'tts', 'end_session'])
 
 
@@ -44,8 +60,42 @@ def _get_entity(entities, entity_type):
         return None
 
 
-def _shot_to_tts(shot):
-    return shot.replace(', ', ' - - - - ')
+class _LatencyEstimate(object):
+    """Exponentially weighted moving average of a stage duration."""
+
+    def __init__(self, weight=0.1):
+        self.weight = weight
+        self.value = 0.0
+
+    def update(self, seconds):
+        self.value += self.weight * (seconds - self.value)
+
+
+_nlu_latency = _LatencyEstimate()
+
+
+def get_nlu_backend():
+    global nlu_backend
+    if nlu_backend is None:
+        with _nlu_lock:
+            if nlu_backend is None:
+                nlu_backend = nlu.load_backend()
+    return nlu_backend
+
+
+def get_fallback_backend():
+    global _fallback_backend
+    if _fallback_backend is None:
+        with _nlu_lock:
+            if _fallback_backend is None:
+                _fallback_backend = nlu.NgramBackend.load()
+    return _fallback_backend
+
+
+@functools.lru_cache(maxsize=None)
+def get_phrase_table(size):
+    """Shot replies for every cell of a `size`x`size` board, built on first use, see seabattle.startup."""
+    return phrases.PhraseTable(size, MESSAGE_TEMPLATES, TTS_TEMPLATES, SHOT_TEMPLATE_KEYS)
 
 
 class DialogManager(object):
@@ -54,25 +104,19 @@ class DialogManager(object):
         self.game = session_obj['game']
         self.opponent = session_obj['opponent']
         self.last = session_obj['last']
+        self.stats = session_obj.get('stats')
+        self.deadline = None
+        self._turn_started = None
+        self._nlu_fallback = False
 
     def _get_dmresponse(self, key, text, tts=None, end_session=False, with_opponent=False):
-        if with_opponent and not text.lower().startswith(self.opponent.lower()):
-            text = '%s, %s' % (self.opponent, text)
-            if tts:
-                tts = '%s - - %s' % (self.opponent, tts)
+        if with_opponent:
+            text, tts = phrases.with_opponent(self.opponent, text, tts)
         return DMResponse(key, text, tts, end_session)
 
     def _get_shot_miss_dmresponse(self, key, shot, with_opponent=False):
-        response_dict = {
-            'shot': shot,
-            'tts_shot': _shot_to_tts(shot),
-        }
-        return self._get_dmresponse(
-            key,
-            MESSAGE_TEMPLATES[key] % response_dict,
-            TTS_TEMPLATES[key] % response_dict,
-            with_opponent=with_opponent
-        )
+        text, tts = get_phrase_table(self.game.size).shot_reply(key, shot)
+        return self._get_dmresponse(key, text, tts, with_opponent=with_opponent)
 
     def _get_dmresponse_by_key(self, key, end_session=False, with_opponent=False):
         return self._get_dmresponse(
@@ -82,17 +126,49 @@ class DialogManager(object):
             with_opponent=with_opponent
         )
 
+    def _game_stats(self):
+        if self.stats is None:
+            self.stats = self.session['stats'] = analytics.new_game_stats()
+        return self.stats
+
+    def _add_stage_time(self, stage, started):
+        if self.game is not None:
+            self._game_stats()['stages'][stage] += time.monotonic() - started
+
+    def _do_shot(self):
+        started = time.monotonic()
+        self.game.deadline = self.deadline
+        try:
+            return self.game.do_shot()
+        finally:
+            self.game.deadline = None
+            self._game_stats()['shots'] += 1
+            self._add_stage_time('game', started)
+
+    def _finish_game(self, result):
+        if self.game is not None:
+            self._add_stage_time('total', self._turn_started)
+            analytics.record(analytics.summarize(self._game_stats(), result, self.game.size, self.opponent))
+        self.session['game'] = self.game = None
+        self.session['stats'] = self.stats = None
+
     def _handle_newgame(self, message, entities):
-        self.game = game.Game()
+        if entities:
+            opponent = _get_entity(entities, 'opponent_entity')
+        else:
+            opponent = 'Алиса'
+
+        # the current game can be resumed later, an old one with the same opponent is replaced
+        session.park_game(self.session)
+        self.session['games'].discard(opponent)
+
+        self.game = gm.Game()
         self.game.reset_last_shot()
         self.session['game'] = self.game
         self.game.start_new_game(numbers=True)
-        if entities:
-            self.opponent = _get_entity(entities, 'opponent_entity')
-        else:
-            self.opponent = 'Алиса'
+        self.session['stats'] = self.stats = analytics.new_game_stats()
 
-        self.session['opponent'] = self.opponent
+        self.session['opponent'] = self.opponent = opponent
         response_dict = {'opponent': self.opponent}
         return self._get_dmresponse(
             'newgame',
@@ -100,11 +176,30 @@ class DialogManager(object):
             TTS_TEMPLATES['newgame'] % response_dict,
         )
 
+    def _handle_resumegame(self, message, entities):
+        opponent = _get_entity(entities, 'opponent_entity')
+        if opponent is None:
+            return self._get_dmresponse_by_key('dontunderstand')
+
+        response_dict = {'opponent': opponent}
+        if not session.resume_game(self.session, opponent):
+            return self._get_dmresponse('nogame', MESSAGE_TEMPLATES['nogame'] % response_dict)
+
+        self.game = self.session['game']
+        self.last = self.session['last']
+        self.stats = self.session['stats']
+        self.opponent = self.session['opponent']
+        return self._get_dmresponse(
+            'resumegame',
+            MESSAGE_TEMPLATES['resumegame'] % response_dict,
+            TTS_TEMPLATES['resumegame'] % response_dict,
+        )
+
     def _handle_letsstart(self, message, entities):
         if self.game is None:
             return self._get_dmresponse_by_key('need_init')
         self.game.reset_last_shot()
-        shot = self.game.do_shot()
+        shot = self._do_shot()
         return self._get_shot_miss_dmresponse('shot', shot, with_opponent=True)
 
     def _handle_miss(self, message, entities):
@@ -116,13 +211,17 @@ class DialogManager(object):
             return self._get_dmresponse_by_key('dontunderstand')
 
         self.game.handle_enemy_reply('miss')
+        started = time.monotonic()
         try:
             enemy_position = self.game.convert_to_position(enemy_shot)
             answer = self.game.handle_enemy_shot(enemy_position)
         except ValueError:
             return self._get_dmresponse_by_key('dontunderstand')
+        finally:
+            self._add_stage_time('game', started)
+        self._game_stats()['enemy_shots'] += 1
         if answer == 'miss':
-            shot = self.game.do_shot()
+            shot = self._do_shot()
             return self._get_shot_miss_dmresponse('miss', shot)
         return self._get_dmresponse(
             answer,
@@ -134,7 +233,7 @@ class DialogManager(object):
             return self._get_dmresponse_by_key('need_init')
 
         self.game.handle_enemy_reply('hit')
-        shot = self.game.do_shot()
+        shot = self._do_shot()
         return self._get_shot_miss_dmresponse('shot', shot)
 
     def _handle_kill(self, message, entities):
@@ -142,14 +241,17 @@ class DialogManager(object):
             return self._get_dmresponse_by_key('need_init')
 
         self.game.handle_enemy_reply('kill')
-        shot = self.game.do_shot()
         if self.game.is_victory():
-            return self._get_dmresponse_by_key('victory')
-        else:
-            return self._get_shot_miss_dmresponse('shot', shot)
+            self._finish_game('victory')
+            return self._get_dmresponse_by_key('victory', True)
+        shot = self._do_shot()
+        return self._get_shot_miss_dmresponse('shot', shot)
 
     def _handle_dontunderstand(self, message, entities):
         if self.game is None:
+            # the game is over, but its last reply can still be repeated
+            if self.last is not None and self.last.key in ('victory', 'defeat'):
+                return self.last
             return self._get_dmresponse_by_key('need_init')
 
         if self.last.key in ['miss', 'shot']:
@@ -158,32 +260,69 @@ class DialogManager(object):
         return self._get_dmresponse(self.last.key, self.last.text, with_opponent=True)
 
     def _handle_victory(self, message, entities):
-        self.session['game'] = self.game = None
+        self._finish_game('defeat')
         return self._get_dmresponse_by_key('defeat', True)
 
     def _handle_defeat(self, message, entities):
-        self.session['game'] = self.game = None
+        self._finish_game('victory')
         return self._get_dmresponse_by_key('victory', True)
 
     def _update_session(self, dmresponse):
         self.session['last'] = self.last = dmresponse
 
-    def handle_message(self, message):
-        data = router.extract({'q': message})
-        router_response = router.parse(data)
+    def _parse(self, message):
+        backend = get_nlu_backend()
+        if self.deadline is not None and backend.name != nlu.NgramBackend.name:
+            time_left = self.deadline - time.monotonic()
+            if time_left < _nlu_latency.value + DEADLINE_RESERVE:
+                metrics.incr('degraded_nlu')
+                self._nlu_fallback = True
+                return get_fallback_backend().parse(message)
+
+        # the reserve is left for the fallback and the shot
+        deadline = None if self.deadline is None else self.deadline - DEADLINE_RESERVE
+        started = time.monotonic()
+        try:
+            router_response = backend.parse(message, deadline)
+        except nlu.NLUTimeout:
+            metrics.incr('degraded_nlu')
+            self._nlu_fallback = True
+            return get_fallback_backend().parse(message)
+        _nlu_latency.update(time.monotonic() - started)
+        return router_response
+
+    @profiling.profiled('handle_message')
+    def handle_message(self, message, deadline=None):
+        """
+        `deadline` is a time.monotonic() value the reply is due by. When it comes close,
+        the fast NLU and shot search are used instead of the full ones.
+        """
+        self.deadline = deadline
+        self._turn_started = time.monotonic()
+        self._nlu_fallback = False
+        router_response = self._parse(message)
         log.info('Router response %s', json.dumps(router_response, indent=2))
 
+        if self.game is not None:
+            stats = self._game_stats()
+            stats['turns'] += 1
+            stats['nlu_fallbacks'] += self._nlu_fallback
+        self._add_stage_time('nlu', self._turn_started)
+
         if router_response['intent']['confidence'] < 0.8:
             dmresponse = self._get_dmresponse_by_key('dontunderstand')
-            return dmresponse
-
-        intent_name = router_response['intent']['name']
-        entities = router_response['entities']
-        handler_method = getattr(self, '_handle_' + intent_name)
-        dmresponse = handler_method(message, entities)
-        if dmresponse.key != 'dontunderstand':
+        else:
+            intent_name = router_response['intent']['name']
+            entities = router_response['entities']
+            handler_method = getattr(self, '_handle_' + intent_name)
+            dmresponse = handler_method(message, entities)
+
+        if dmresponse.key == 'dontunderstand' and self.game is not None:
+            self._game_stats()['dontunderstand'] += 1
+        if dmresponse.key not in NOT_SAVED_KEYS:
             # сохраняем только последний осмысленный ответ в сессии не затыкались после нескольких повтори
             self._update_session(dmresponse)
+        self._add_stage_time('total', self._turn_started)
 
         if self.session.get('game') is not None:
             log.info('My field:')
@@ -0,0 +1,189 @@
+# coding: utf-8
+
+import argparse
+import collections
+import random
+
+from seabattle import game as gm
+from seabattle import simulate
+
+
+Case = collections.namedtuple('Case', ['seed', 'size', 'ships', 'field', 'enemy_layout', 'actions'])
+Observation = collections.namedtuple('Observation', [
+    'action', 'result', 'field', 'enemy_field', 'ships_count', 'enemy_ships_count',
+    'last_shot_position', 'last_shot_damage', 'next_shot_index',
+])
+Failure = collections.namedtuple('Failure', ['case', 'step', 'expected', 'actual'])
+
+# actions of a case: the engine shoots, its reply is given by `enemy_layout`,
+# or the enemy shoots at the engine's `field`
+SHOOT = ('shoot', None)
+
+
+def _enemy_shot(position):
+    return ('enemy', position)
+
+
+def _random_field(size, ships):
+    field_game = gm.Game()
+    field_game.start_new_game(size, [gm.EMPTY] * size ** 2, ships)
+    field_game.generate_random_field()
+    return tuple(field_game.field)
+
+
+def generate_case(seed, size=10, ships=None, steps=200, shoot_share=0.5):
+    """Random own and enemy fields and a random mix of own shots and enemy shots, repeats included."""
+    ships = list(ships or gm.BaseGame.default_ships)
+    rng = random.Random(seed)
+
+    state = random.getstate()
+    random.seed(rng.random())
+    try:
+        field = _random_field(size, ships)
+        enemy_layout = _random_field(size, ships)
+    finally:
+        random.setstate(state)
+
+    actions = []
+    for _ in range(steps):
+        if rng.random() < shoot_share:
+            actions.append(SHOOT)
+        else:
+            actions.append(_enemy_shot((rng.randint(1, size), rng.randint(1, size))))
+
+    return Case(seed, size, ships, field, enemy_layout, tuple(actions))
+
+
+def _observe(engine, action, result):
+    return Observation(
+        action, result, tuple(engine.field), tuple(engine.enemy_field), engine.ships_count,
+        engine.enemy_ships_count, engine.last_shot_position, engine.last_shot_damage, engine.next_shot_index,
+    )
+
+
+def trace(case, engine_cls):
+    """Play `case` with a fresh `engine_cls` instance, yielding an observation after every action."""
+    engine = engine_cls()
+    engine.start_new_game(case.size, list(case.field), list(case.ships), numbers=True)
+    opponent = gm.Game()
+    opponent.start_new_game(case.size, list(case.enemy_layout), list(case.ships), numbers=True)
+
+    state = random.getstate()
+    try:
+        for step, action in enumerate(case.actions):
+            # both engines see the same random numbers at every step
+            random.seed(case.seed * 1000003 + step)
+            try:
+                if action == SHOOT:
+                    shot = engine.do_shot()
+                    reply = opponent.handle_enemy_shot(engine.convert_to_position(simulate.prepare_text_coords(shot)))
+                    engine.handle_enemy_reply(reply)
+                    result = (shot, reply)
+                else:
+                    result = engine.handle_enemy_shot(action[1])
+            except Exception as e:
+                result = ('error', type(e).__name__)
+            yield _observe(engine, action, result)
+    finally:
+        random.setstate(state)
+
+
+def compare(case, reference_cls, candidate_cls):
+    """Run both engines in lockstep, returns the first divergence as a Failure or None."""
+    expected_trace = trace(case, reference_cls)
+    actual_trace = trace(case, candidate_cls)
+    for step, (expected, actual) in enumerate(zip(expected_trace, actual_trace)):
+        if expected != actual:
+            return Failure(case, step, expected, actual)
+    return None
+
+
+def shrink(case, fails):
+    """Delta debugging over the actions of a failing case: drop chunks of actions while it still fails."""
+    actions = list(case.actions)
+    chunks = 2
+
+    while len(actions) >= 2:
+        chunk_size = -(-len(actions) // chunks)
+        for start in range(0, len(actions), chunk_size):
+            reduced = actions[:start] + actions[start + chunk_size:]
+            if fails(case._replace(actions=tuple(reduced))):
+                actions = reduced
+                chunks = max(chunks - 1, 2)
+                break
+        else:
+            if chunks >= len(actions):
+                break
+            chunks = min(chunks * 2, len(actions))
+
+    if len(actions) == 1 and fails(case._replace(actions=())):
+        actions = []
+    return case._replace(actions=tuple(actions))
+
+
+def check(candidate_cls, reference_cls=gm.Game, cases=100, seed=0, size=10, ships=None, steps=200):
+    """
+    Compare `candidate_cls` with `reference_cls` on `cases` random cases.
+    Returns the first failure, with its case shrunk, or None if the engines agree.
+    """
+    for i in range(cases):
+        case = generate_case(seed + i, size, ships, steps)
+        if compare(case, reference_cls, candidate_cls) is None:
+            continue
+
+        case = shrink(case, lambda c: compare(c, reference_cls, candidate_cls) is not None)
+        return compare(case, reference_cls, candidate_cls)
+    return None
+
+
+def format_failure(failure):
+    case = failure.case
+    lines = ['Engines diverge at step %d of case seed=%d size=%d ships=%s' % (
+        failure.step, case.seed, case.size, case.ships)]
+
+    for title, field in (('Field:', case.field), ('Enemy layout:', case.enemy_layout)):
+        lines.append(title)
+        for y in range(case.size):
+            lines.append('  ' + ''.join('1' if v == gm.SHIP else '.' for v in field[y * case.size:(y + 1) * case.size]))
+
+    lines.append('Actions: %s' % (list(case.actions),))
+    for name, expected in failure.expected._asdict().items():
+        actual = getattr(failure.actual, name)
+        if expected == actual:
+            continue
+        if name in ('field', 'enemy_field'):
+            cells = ['(%d, %d): %s/%s' % (i % case.size + 1, i // case.size + 1, e, a)
+                     for i, (e, a) in enumerate(zip(expected, actual)) if e != a]
+            lines.append('%s cells differ, expected/got: %s' % (name, ', '.join(cells)))
+        else:
+            lines.append('%s: expected %r, got %r' % (name, expected, actual))
+    return '\n'.join(lines)
+
+
+def assert_equivalent(candidate_cls, reference_cls=gm.Game, **kwargs):
+    failure = check(candidate_cls, reference_cls, **kwargs)
+    if failure is not None:
+        raise AssertionError(format_failure(failure))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check a Game implementation gives the same results as the reference')
+    parser.add_argument('candidate', help='module with the candidate Game implementation')
+    parser.add_argument('--reference', default='seabattle.game', help='module with the reference Game implementation')
+    parser.add_argument('--cases', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--size', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=200)
+    args = parser.parse_args()
+
+    failure = check(simulate.load_game_class(args.candidate), simulate.load_game_class(args.reference),
+                    args.cases, args.seed, args.size, steps=args.steps)
+    if failure is None:
+        print('No differences in %d cases' % args.cases)
+    else:
+        print(format_failure(failure))
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+# coding: utf-8
+
+import collections
+import logging
+import os
+import time
+
+from seabattle import game as gm
+from seabattle import metrics
+from seabattle import solver
+from seabattle import strategies
+
+
+log = logging.getLogger(__name__)
+
+# the exact search runs only if the remaining ships have at most this many layouts
+ENDGAME_LAYOUTS = int(os.environ.get('SEABATTLE_ENDGAME_LAYOUTS', 30))
+# time for one exact shot, the game deadline shortens it further
+ENDGAME_BUDGET = float(os.environ.get('SEABATTLE_ENDGAME_BUDGET_MS', 20)) / 1000
+
+MISS = 'miss'
+HIT = 'hit'
+KILL = 'kill'
+WIN = 'win'
+
+
+class Timeout(Exception):
+    pass
+
+
+def _popcount(mask):
+    return bin(mask).count('1')
+
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _ring(cells, size):
+    ring = 0
+    for index in _bits(cells):
+        x, y = index % size, index // size
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < size and 0 <= ny < size:
+                    ring |= 1 << (ny * size + nx)
+    return ring & ~cells
+
+
+def placements(field, size, hits, length):
+    """
+    Bitmasks (cells, cells with neighbours) of every placement of a ship of `length` on
+    cells which are EMPTY or in `hits`, with no hit touching it from outside.
+    """
+    result = []
+    steps = [1] if length == 1 else [1, size]
+    for step in steps:
+        for y in range(size):
+            for x in range(size):
+                if (x if step == 1 else y) + length > size:
+                    continue
+                first = y * size + x
+                cells = [first + step * i for i in range(length)]
+                if any(field[c] != gm.EMPTY and not hits >> c & 1 for c in cells):
+                    continue
+                mask = sum(1 << c for c in cells)
+                ring = _ring(mask, size)
+                if ring & hits:
+                    continue
+                result.append((mask, mask | ring))
+    return result
+
+
+def enumerate_layouts(field, size, hits, fleet, limit, deadline=None):
+    """
+    Every layout of the ships of `fleet` consistent with the enemy field: they cover all
+    `hits` (a bitmask) and don't touch each other. A layout is a tuple of ship bitmasks.
+
+    Returns None if there are more than `limit` layouts or time.monotonic() passes `deadline`.
+    """
+    lengths = sorted(fleet, reverse=True)
+    options = {length: placements(field, size, hits, length) for length in set(lengths)}
+    left = [sum(lengths[i:]) for i in range(len(lengths) + 1)]
+    layouts = []
+    nodes = [0]
+
+    def _place(i, start, forbidden, covered, ships):
+        nodes[0] += 1
+        if deadline is not None and not nodes[0] % 256 and time.monotonic() > deadline:
+            raise Timeout()
+        if i == len(lengths):
+            if covered & hits == hits:
+                layouts.append(tuple(ships))
+                if len(layouts) > limit:
+                    raise Timeout()
+            return
+        if _popcount(hits & ~covered) > left[i]:
+            return
+
+        # ships of the same length are placed in order, each layout is found once
+        first = start if i and lengths[i] == lengths[i - 1] else 0
+        candidates = options[lengths[i]]
+        for j in range(first, len(candidates)):
+            mask, area = candidates[j]
+            if mask & forbidden:
+                continue
+            ships.append(mask)
+            _place(i + 1, j + 1, forbidden | area, covered | mask, ships)
+            ships.pop()
+
+    try:
+        _place(0, 0, 0, 0, [])
+    except Timeout:
+        return None
+    return layouts
+
+
+def _shoot(ships, cell):
+    """Reply to a shot at `cell` and what is left of `ships`, a sorted tuple of cells not hit yet."""
+    bit = 1 << cell
+    for i, ship in enumerate(ships):
+        if ship & bit:
+            if ship != bit:
+                return HIT, tuple(sorted(ships[:i] + (ship & ~bit,) + ships[i + 1:]))
+            left = ships[:i] + ships[i + 1:]
+            return (KILL if left else WIN), left
+    return MISS, ships
+
+
+class ExactSolver(object):
+    """
+    Expected number of shots to sink the remaining ships, minimized over the order of
+    shots, for a uniform distribution over `layouts`. Searches all replies with branch
+    and bound. A position is what is left of the consistent layouts, so positions
+    reached by different shots are memoized together.
+    """
+
+    def __init__(self, layouts, hits, deadline=None):
+        self.deadline = deadline
+        self.memo = {}
+        left = collections.Counter(tuple(sorted(ship & ~hits for ship in layout if ship & ~hits))
+                                   for layout in layouts)
+        self.root = frozenset(left.items())
+
+    def cell_counts(self, position):
+        counts = collections.Counter()
+        for ships, weight in position:
+            for ship in ships:
+                for cell in _bits(ship):
+                    counts[cell] += weight
+        return counts
+
+    def lower_bound(self, position):
+        """
+        Every cell of the actual layout which is not hit yet takes a shot. Besides, a miss
+        rules out at most `most` layouts, the most sharing a cell, so the misses before the
+        first hit are at least 0 for `most` layouts, 1 for the next `most` and so on.
+        """
+        counts = self.cell_counts(position)
+        total = sum(weight for _, weight in position)
+        most = max(counts.values()) if counts else total
+        rounds, rest = divmod(total, most)
+        misses = most * rounds * (rounds - 1) / 2 + rest * rounds
+        return (sum(counts.values()) + misses) / total
+
+    def expected(self, position):
+        """Returns (expected shots, best cell) in `position`, a frozenset of (ships left, layouts)."""
+        if position in self.memo:
+            return self.memo[position]
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise Timeout()
+
+        counts = self.cell_counts(position)
+        if not counts:
+            return 0.0, None
+        total = sum(weight for _, weight in position)
+        # likely hits first, so that the bound prunes early
+        candidates = sorted(counts, key=lambda cell: (-counts[cell], cell))
+        if counts[candidates[0]] == total:
+            # a cell of every layout takes a shot anyway, the earlier the more it tells
+            candidates = candidates[:1]
+
+        best = (float('inf'), None)
+        for cell in candidates:
+            replies = collections.defaultdict(collections.Counter)
+            for ships, weight in position:
+                reply, left = _shoot(ships, cell)
+                if reply != WIN:
+                    replies[reply][left] += weight
+
+            parts = []
+            for left in replies.values():
+                child = frozenset(left.items())
+                parts.append((sum(left.values()) / total, child, self.lower_bound(child)))
+
+            value = 1 + sum(p * bound for p, _, bound in parts)
+            for p, child, bound in parts:
+                if value >= best[0]:
+                    break
+                value += p * (self.expected(child)[0] - bound)
+            if value < best[0]:
+                best = (value, cell)
+
+        self.memo[position] = best
+        return best
+
+    def solve(self):
+        return self.expected(self.root)
+
+    def most_likely_cell(self):
+        counts = self.cell_counts(self.root)
+        return min(counts, key=lambda cell: (-counts[cell], cell)) if counts else None
+
+
+@strategies.register
+class EndgameStrategy(solver.MonteCarloStrategy):
+    """
+    The montecarlo strategy, but once the ships still afloat have at most `max_layouts`
+    layouts, the shot minimizing the expected number of remaining shots is found exactly,
+    and no layouts are sampled. If the search doesn't finish in time, the cell hit by most
+    of the layouts is shot.
+    """
+
+    name = 'endgame'
+    max_layouts = ENDGAME_LAYOUTS
+    endgame_budget = ENDGAME_BUDGET
+    # with more ships afloat layouts are never few enough, don't spend time counting them
+    max_ships = 4
+
+    def choose_shot(self, game):
+        # in target mode find_target has already chosen
+        if game.next_shot_index is None:
+            index = self.endgame_shot(game)
+            if index is not None:
+                return index
+        return super(EndgameStrategy, self).choose_shot(game)
+
+    def find_target(self, game):
+        # without time left sampling gives way to the line walk and counts it
+        if self.solver_budget(game):
+            index = self.endgame_shot(game)
+            if index is not None:
+                game.next_shot_index = index
+                return
+        super(EndgameStrategy, self).find_target(game)
+
+    def endgame_shot(self, game):
+        fleet = self.remaining_fleet(game)
+        if 0 < len(fleet) <= self.max_ships:
+            return self.exact_shot(game, fleet)
+        return None
+
+    def exact_shot(self, game, fleet):
+        budget = self.endgame_budget
+        time_left = game.time_left()
+        if time_left is not None:
+            budget = min(budget, time_left - self.deadline_margin)
+        if budget <= 0:
+            metrics.incr('degraded_shot')
+            return None
+        deadline = time.monotonic() + budget
+
+        hits = sum(1 << i for i in self.unsunk_hits(game))
+        layouts = enumerate_layouts(game.enemy_field, game.size, hits, fleet, self.max_layouts, deadline)
+        if layouts is None and time.monotonic() > deadline:
+            # too many layouts is the usual case, running out of time is not
+            metrics.incr('degraded_shot')
+        if not layouts:
+            return None
+
+        exact = ExactSolver(layouts, hits, deadline)
+        try:
+            expected, index = exact.solve()
+        except Timeout:
+            metrics.incr('endgame_timeouts')
+            return exact.most_likely_cell()
+        if index is None:
+            return None
+
+        log.debug('Endgame: %d layouts, %.2f shots expected, shot at %s',
+                  len(layouts), expected, game.calc_position(index))
+        return index
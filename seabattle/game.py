@@ -1,14 +1,16 @@
 # coding: utf-8
 
-from __future__ import unicode_literals
-
+import bisect
+import json
+import os
 import random
 import re
 import logging
 import math
-from itertools import product, chain
+import time
+from itertools import product
 
-from transliterate import translit
+from seabattle import profiling
 
 EMPTY = 0
 SHIP = 1
@@ -22,13 +24,209 @@ LAYOUT_VERTICAL = 1
 LAYOUT_HORIZONTAL = 2
 LAYOUT_UNKNOWN = -1
 
+LAYOUTS_PATH = os.environ.get('SEABATTLE_LAYOUTS', 'mldata/layouts.json')
+
+# числительные для координат на больших полях: "двадцать один", "сто пять"
+UNIT_WORDS = ['один', 'два', 'три', 'четыре', 'пять', 'шесть', 'семь', 'восемь', 'девять']
+TEEN_WORDS = ['десять', 'одиннадцать', 'двенадцать', 'тринадцать', 'четырнадцать', 'пятнадцать',
+              'шестнадцать', 'семнадцать', 'восемнадцать', 'девятнадцать']
+TEN_WORDS = ['двадцать', 'тридцать', 'сорок', 'пятьдесят', 'шестьдесят', 'семьдесят', 'восемьдесят', 'девяносто']
+HUNDRED_WORDS = ['сто', 'двести', 'триста', 'четыреста', 'пятьсот', 'шестьсот', 'семьсот', 'восемьсот', 'девятьсот']
+
+# word: (value, rank), ranks of a numeral go down from hundreds to units
+NUMBER_WORDS = {}
+NUMBER_WORDS.update((w, (i + 1, 0)) for i, w in enumerate(UNIT_WORDS))
+NUMBER_WORDS.update((w, (i + 10, 1)) for i, w in enumerate(TEEN_WORDS))
+NUMBER_WORDS.update((w, ((i + 2) * 10, 2)) for i, w in enumerate(TEN_WORDS))
+NUMBER_WORDS.update((w, ((i + 1) * 100, 3)) for i, w in enumerate(HUNDRED_WORDS))
+
 log = logging.getLogger(__name__)
+_layouts = {}
+
+
+def parse_number_words(words):
+    """Value of a numeral like ['сто', 'двадцать', 'пять'], ValueError if `words` is not one."""
+    total = 0
+    last_rank = None
+
+    for word in words:
+        if word not in NUMBER_WORDS:
+            raise ValueError('Not a number: %s' % ' '.join(words))
+        value, rank = NUMBER_WORDS[word]
+        # teens end a numeral and can't follow tens: "двадцать одиннадцать"
+        if last_rank is not None and (rank >= last_rank or last_rank == 1 or (last_rank == 2 and rank == 1)):
+            raise ValueError('Not a number: %s' % ' '.join(words))
+        total += value
+        last_rank = rank
+
+    if last_rank is None:
+        raise ValueError('Not a number')
+    return total
+
+
+def load_layouts(path=None):
+    """Load the pool of pregenerated fields written by `seabattle.layouts`, once per path."""
+    path = path or LAYOUTS_PATH
+
+    if path not in _layouts:
+        try:
+            with open(path, encoding='utf-8') as f:
+                _layouts[path] = json.load(f)
+        except (OSError, ValueError):
+            _layouts[path] = None
+
+    return _layouts[path]
+
+
+class Field(list):
+    """
+    List of cells which remembers indexes assigned since the last `take_changes()`, so
+    indexes over the field are updated after a shot instead of being rebuilt.
+    """
+
+    def __init__(self, cells=()):
+        super(Field, self).__init__(cells)
+        self.changed = set()
+        self.reset = True
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self.reset = True
+        else:
+            self.changed.add(index if index >= 0 else index + len(self))
+        super(Field, self).__setitem__(index, value)
+
+    def take_changes(self):
+        """Returns (reset, changed indexes), reset means anything may have changed."""
+        reset, changed = self.reset, self.changed
+        self.reset, self.changed = False, set()
+        return reset, changed
+
+
+def _reset_on_call(name):
+    method = getattr(list, name)
+
+    def wrapper(self, *args, **kwargs):
+        self.reset = True
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in ('__delitem__', '__iadd__', '__imul__', 'append', 'extend', 'insert', 'pop', 'remove',
+              'reverse', 'sort', 'clear'):
+    setattr(Field, _name, _reset_on_call(_name))
+
+
+def _line_runs(line):
+    """(start, middle, length) of every run of EMPTY cells in `line`, 1-based."""
+    runs = []
+    start = None
+
+    for i, value in enumerate(line, 1):
+        if value == EMPTY:
+            if start is None:
+                start = i
+        elif start is not None:
+            runs.append((start, i - 1 - (i - 1 - start) // 2, i - start))
+            start = None
+
+    if start is not None:
+        end = len(line)
+        runs.append((start, end - (end - start) // 2, end - start + 1))
+
+    return runs
+
+
+HORIZONTAL = 0
+VERTICAL = 1
+
+
+class LineIndex(object):
+    """
+    Runs of EMPTY cells in every row and column of a field, bucketed by length, and the
+    sorted list of EMPTY cells. A changed cell costs O(size) to update instead of
+    O(size ** 2) to rescan, the longest runs are looked up in O(1).
+
+    A bucket is kept in the order of a full scan: rows from top to bottom, then columns
+    from left to right, runs of a line from its start. So random.choice of a bucket picks
+    the same point as random.choice of the scan result would.
+    """
+
+    def __init__(self, field, size):
+        self.field = field
+        self.size = size
+        self.rebuild()
+
+    def rebuild(self):
+        self.empty = [i for i, v in enumerate(self.field) if v == EMPTY]
+        # length: [(orientation, line, start, middle point), ...]
+        self.buckets = {}
+        # (orientation, line): [(length, bucket entry), ...]
+        self.lines = {}
+        self.max_length = 0
+
+        for orientation in (HORIZONTAL, VERTICAL):
+            for i in range(self.size):
+                self._update_line(orientation, i)
+
+    def _update_line(self, orientation, i):
+        for length, entry in self.lines.get((orientation, i), ()):
+            bucket = self.buckets[length]
+            del bucket[bisect.bisect_left(bucket, entry)]
+
+        if orientation == HORIZONTAL:
+            line = self.field[i * self.size:(i + 1) * self.size]
+        else:
+            line = self.field[i::self.size]
+
+        runs = []
+        for start, middle, length in _line_runs(line):
+            point = (middle, i + 1) if orientation == HORIZONTAL else (i + 1, middle)
+            entry = (orientation, i, start, point)
+            bisect.insort(self.buckets.setdefault(length, []), entry)
+            runs.append((length, entry))
+            self.max_length = max(self.max_length, length)
+        self.lines[(orientation, i)] = runs
+
+        while self.max_length and not self.buckets.get(self.max_length):
+            self.max_length -= 1
+
+    def update(self, changed):
+        rows = set()
+        columns = set()
+
+        for index in changed:
+            rows.add(index // self.size)
+            columns.add(index % self.size)
+
+            pos = bisect.bisect_left(self.empty, index)
+            present = pos < len(self.empty) and self.empty[pos] == index
+            if self.field[index] == EMPTY:
+                if not present:
+                    self.empty.insert(pos, index)
+            elif present:
+                del self.empty[pos]
+
+        for y in rows:
+            self._update_line(HORIZONTAL, y)
+        for x in columns:
+            self._update_line(VERTICAL, x)
+
+    def longest_runs(self):
+        """Bucket of the longest runs, empty if there are no EMPTY cells."""
+        return self.buckets.get(self.max_length, []) if self.max_length else []
+
+    def longest_lines_points(self):
+        """(middle point, length) of the longest runs, in the order of a full scan."""
+        return [(entry[3], self.max_length) for entry in self.longest_runs()]
 
 
 class BaseGame(object):
-    position_patterns = [re.compile('^([a-zа-я]+)(\d+)$', re.UNICODE),  # a1
-                         re.compile('^([a-zа-я]+)\s+(\w+)$', re.UNICODE),  # a 1; a один
-                         re.compile('^(\w+)\s+(\w+)$', re.UNICODE),  # a 1; a один; 7 10
+    position_patterns = [re.compile(r'^([a-zа-я]+)(\d+)$'),  # a1
+                         re.compile(r'^([a-zа-я]+)\s+(\w+)$'),  # a 1; a один
+                         re.compile(r'^(\w+)\s+(\w+)$'),  # a 1; a один; 7 10
                          ]
 
     str_letters = ['а', 'б', 'в', 'г', 'д', 'е', 'ж', 'з', 'и', 'к']
@@ -43,6 +241,9 @@ class BaseGame(object):
 
     default_ships = [4, 3, 3, 2, 2, 2, 1, 1, 1, 1]
 
+    # time.monotonic() value the next shot must be chosen by, None means no limit
+    deadline = None
+
     def __init__(self):
         self.size = 0
         self.ships = None
@@ -59,7 +260,7 @@ class BaseGame(object):
         self.numbers = None
 
     def start_new_game(self, size=10, field=None, ships=None, numbers=None):
-        assert(size <= 10)
+        assert(size >= 1)
         assert(len(field) == size ** 2 if field is not None else True)
 
         self.size = size
@@ -86,6 +287,10 @@ class BaseGame(object):
         raise NotImplementedError()
 
     def print_field(self, field=None):
+        # the picture is size ** 2 characters, don't draw it for nothing on every shot
+        if not log.isEnabledFor(logging.INFO):
+            return
+
         if not self.size:
             log.info('Empty field')
             return
@@ -144,6 +349,9 @@ class BaseGame(object):
             _line_is_dead(self.field[y * self.size:(y + 1) * self.size], x)
         )
 
+    def time_left(self):
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
     def is_end_game(self):
         return self.is_victory() or self.is_defeat()
 
@@ -195,15 +403,13 @@ class BaseGame(object):
     def calc_index(self, position):
         x, y = position
 
-        print(x, y)
-
         if x > self.size or y > self.size:
             raise ValueError('Wrong position: %s %s' % (x, y))
 
         return (y - 1) * self.size + x - 1
 
     def calc_position(self, index):
-        y = index / self.size + 1
+        y = index // self.size + 1
         x = index % self.size + 1
 
         return x, y
@@ -216,7 +422,7 @@ class BaseGame(object):
             if match is not None:
                 break
         else:
-            raise ValueError('Can\'t parse entire position: %s' % position)
+            return self._convert_number_words(position.split())
 
         bits = match.groups()
 
@@ -224,7 +430,8 @@ class BaseGame(object):
             # проверяем особые случаи неправильного распознования STT
             bit = self.letters_mapping.get(bit, bit)
 
-            # преобразуем в кириллицу
+            # преобразуем в кириллицу, transliterate грузится долго, поэтому только здесь
+            from transliterate import translit
             bit = translit(bit, 'ru')
 
             try:
@@ -239,10 +446,7 @@ class BaseGame(object):
             if bit.isdigit():
                 return int(bit)
             else:
-                try:
-                    return self.str_numbers.index(bit) + 1
-                except ValueError:
-                    raise
+                return parse_number_words([bit])
 
         x = bits[0].strip()
         try:
@@ -258,10 +462,21 @@ class BaseGame(object):
 
         return x, y
 
+    def _convert_number_words(self, words):
+        # "двадцать один тридцать": ищем, где кончается первое числительное
+        for i in range(1, len(words)):
+            try:
+                return parse_number_words(words[:i]), parse_number_words(words[i:])
+            except ValueError:
+                continue
+
+        raise ValueError('Can\'t parse entire position: %s' % ' '.join(words))
+
     def convert_from_position(self, position, numbers=None):
         numbers = numbers if numbers is not None else self.numbers
 
-        if numbers:
+        # букв хватает только на десять столбцов
+        if numbers or position[0] > len(self.str_letters):
             x = position[0]
         else:
             x = self.str_letters[position[0] - 1]
@@ -272,11 +487,59 @@ class BaseGame(object):
 
 
 class Game(BaseGame):
+    # random placements of a ship tried before the whole field is generated again
+    place_attempts = 1000
+    field_attempts = 100
+
+    # pool of fields drawn by generate_field, None is LAYOUTS_PATH, '' generates them uniformly
+    layouts_path = None
+
+    # registered strategy name, None plays the one configured for new games, see seabattle.strategies
+    strategy_name = None
+    strategy = None
+
+    _line_index = None
+
+    def __getstate__(self):
+        # the index is rebuilt from the field on the next shot, no need to store it
+        state = self.__dict__.copy()
+        state.pop('_line_index', None)
+        return state
+
+    def start_new_game(self, *args, layouts=None, **kwargs):
+        """`layouts` overrides `layouts_path` of this game."""
+        if layouts is not None:
+            self.layouts_path = layouts
+        super(Game, self).start_new_game(*args, **kwargs)
+        self.strategy = None
+        self.get_strategy()
+
+    def get_strategy(self):
+        # imported here, the strategies module imports this one
+        from seabattle import strategies
+
+        # also for games pickled before strategies
+        if self.strategy is None:
+            self.strategy = strategies.create(self.strategy_name)
+            self.strategy.reset(self)
+        return self.strategy
+
     def generate_field(self):
-        self.field = [0] * self.size ** 2
+        pool = load_layouts(self.layouts_path) if self.layouts_path != '' else None
+
+        if pool and pool['size'] == self.size and pool['ships'] == list(self.ships):
+            self.field = list(random.choice(pool['layouts']))
+        else:
+            self.generate_random_field()
+
+    def generate_random_field(self):
+        for _ in range(self.field_attempts):
+            self.field = [0] * self.size ** 2
 
-        for length in self.ships:
-            self.place_ship(length)
+            if all(self.place_ship(length) for length in self.ships):
+                break
+        else:
+            raise ValueError('Can\'t place ships %s on %sx%s field' % (self.ships, self.size, self.size))
 
         for i in range(len(self.field)):
             if self.field[i] == BLOCKED:
@@ -317,8 +580,10 @@ class Game(BaseGame):
 
             return True
 
-        while not _try_to_place():
-            pass
+        for _ in range(self.place_attempts):
+            if _try_to_place():
+                return True
+        return False
 
     def is_point_invalid(self, p):
         return p[0] <= 0 or p[1] <= 0 or p[0] > self.size or p[1] > self.size
@@ -411,53 +676,59 @@ class Game(BaseGame):
             for r in self.generate_lines(i, 1):
                 yield r
 
-    def get_random_filtered_point(self):
-        all_points = list(chain(self.generate_horizontal_lines_points(),
-                                self.generate_vertical_lines_points()))
+    def get_line_index(self):
+        if not isinstance(self.enemy_field, Field):
+            self.enemy_field = Field(self.enemy_field)
+
+        index = self._line_index
+        reset, changed = self.enemy_field.take_changes()
+        if index is None or index.field is not self.enemy_field or index.size != self.size or reset:
+            index = self._line_index = LineIndex(self.enemy_field, self.size)
+        elif changed:
+            index.update(changed)
+        return index
 
-        max_length = max(a[1] for a in all_points)
-        p = random.choice(filter(lambda x: x[1] == max_length, all_points))
+    def get_random_filtered_point(self):
+        index = self.get_line_index()
+        p = (random.choice(index.longest_runs())[3], index.max_length)
         if self.enemy_field[self.calc_index(p[0])] != EMPTY:
             raise Exception
 
         return p
 
     def get_random_field(self):
+        # the line index keeps the longest runs up to date, so the search costs no more than a random cell
         try:
             p = self.get_random_filtered_point()
             return self.calc_index(p[0])
         except:
             pass
 
-        return random.choice([i for i, v in enumerate(self.enemy_field) if v == EMPTY])
+        return random.choice(self.get_line_index().empty)
 
+    @profiling.profiled('do_shot')
     def do_shot(self):
-        if self.next_shot_index is None:
-            index = self.get_random_field()
-        else:
-            index = self.next_shot_index
+        index = self.get_strategy().choose_shot(self)
 
         self.last_shot_position = self.calc_position(index)
 
         self.next_shot_index = None  # Reset for next iteration
-        print(self.last_shot_position)
+        log.debug('Shot at %s', self.last_shot_position)
         return self.convert_from_position(self.last_shot_position)
 
     def after_enemy_ship_killed(self):
         """After enemy ship has killed, we need markup skip border around this one."""
         self.disable_for_shot_all_near()
-        self.last_shot_damage = None
+        self.get_strategy().on_reply(self, 'kill')
 
     def after_enemy_ship_damaged(self):
-        self.last_shot_damage = self.last_shot_position
-        self.try_detect_next_ship_cell()
+        self.get_strategy().on_reply(self, 'hit')
 
     def after_our_miss(self):
-        if self.last_shot_damage is not None:
-            self.try_detect_next_ship_cell()
+        self.get_strategy().on_reply(self, 'miss')
 
     def common_line_finder(self, pos, direction, c):
-        print('cf pos {}, d {}, c {}'.format(pos, direction, c))
+        log.debug('cf pos %s, d %s, c %s', pos, direction, c)
 
         def plus(p):
             new_p = list(p)
@@ -0,0 +1,68 @@
+# coding: utf-8
+
+import collections
+import threading
+import time
+
+
+class Overloaded(Exception):
+    """The request can't be answered before its deadline."""
+
+
+class _Call(object):
+    def __init__(self):
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class RequestCoalescer(object):
+    """
+    Runs the handler once per request key. Duplicates arriving while the first request
+    is processed wait for its result, completed ones are answered from a bounded cache
+    of the most recent results. Failed calls are not cached, so a retry runs again.
+
+    A duplicate waits no longer than its `deadline`, a time.monotonic() value, and raises
+    Overloaded then, so a stuck first request doesn't hold every retry.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._done = collections.OrderedDict()
+
+    def run(self, key, handler, deadline=None):
+        with self._lock:
+            if key in self._done:
+                self._done.move_to_end(key)
+                return self._done[key]
+
+            call = self._in_flight.get(key)
+            is_owner = call is None
+            if is_owner:
+                call = self._in_flight[key] = _Call()
+
+        if not is_owner:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not call.done.wait(timeout):
+                raise Overloaded()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = handler()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if call.error is None:
+                    self._done[key] = call.result
+                    if len(self._done) > self.max_size:
+                        self._done.popitem(last=False)
+                del self._in_flight[key]
+            call.done.set()
+
+        return call.result
@@ -0,0 +1,110 @@
+# coding: utf-8
+
+import argparse
+import json
+import logging
+import multiprocessing
+import random
+import time
+
+from seabattle import game as gm
+from seabattle import simulate
+
+
+log = logging.getLogger(__name__)
+
+
+def shots_to_sink(shooter_cls, field, size, ships):
+    """Count how many shots `shooter_cls` needs to sink every ship on `field`."""
+    shooter = shooter_cls()
+    shooter.start_new_game(size, ships=ships, numbers=True)
+    target = gm.Game()
+    target.start_new_game(size, list(field), ships)
+
+    # guard against strategies which never finish a game
+    max_shots = 2 * size ** 2
+    shots = 0
+    while not target.is_defeat() and shots < max_shots:
+        coords = shooter.convert_to_position(simulate.prepare_text_coords(shooter.do_shot()))
+        shooter.handle_enemy_reply(target.handle_enemy_shot(coords))
+        shots += 1
+
+    return shots
+
+
+def score_candidate(task):
+    """Generate a field from `seed` and return its mean shots to sink over all shooters."""
+    seed, shooters, games, size, ships = task
+    random.seed(seed)
+
+    field_game = gm.Game()
+    field_game.size = size
+    field_game.ships = ships
+    field_game.generate_random_field()
+    field = field_game.field
+
+    shooter_classes = [simulate.load_game_class(name) for name in shooters]
+    total = sum(shots_to_sink(shooter_cls, field, size, ships)
+                for shooter_cls in shooter_classes
+                for _ in range(games))
+
+    return total / (len(shooter_classes) * games), field
+
+
+def generate(candidates, keep, shooters, games=5, processes=None, size=10, ships=None, seed=None):
+    """Sample `candidates` fields and return the `keep` hardest ones as (score, field) pairs."""
+    ships = list(ships or gm.BaseGame.default_ships)
+    seed = seed if seed is not None else random.randint(0, 2 ** 31)
+    tasks = [(seed + i, shooters, games, size, ships) for i in range(candidates)]
+
+    if processes == 1:
+        scored = list(map(score_candidate, tasks))
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            scored = pool.map(score_candidate, tasks, chunksize=max(1, candidates // (8 * (processes or 4))))
+        finally:
+            pool.close()
+            pool.join()
+
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return scored[:keep]
+
+
+def save(path, best, shooters, size=10, ships=None):
+    data = {
+        'size': size,
+        'ships': list(ships or gm.BaseGame.default_ships),
+        'shooters': shooters,
+        'scores': [score for score, _ in best],
+        'layouts': [field for _, field in best],
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(data, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a pool of fields hard to shoot down')
+    parser.add_argument('--candidates', type=int, default=2000, help='number of random fields to score')
+    parser.add_argument('--keep', type=int, default=200, help='number of best fields to keep in the pool')
+    parser.add_argument('--shooters', nargs='+', default=['seabattle.game'],
+                        help='modules with Game implementations the fields are scored against')
+    parser.add_argument('--games', type=int, default=5, help='games per shooter for every field')
+    parser.add_argument('--processes', type=int, help='worker processes, all cores by default')
+    parser.add_argument('--size', type=int, default=10)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', default=gm.LAYOUTS_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(message)s', level=logging.WARNING)
+
+    started = time.time()
+    best = generate(args.candidates, args.keep, args.shooters, args.games, args.processes, args.size, seed=args.seed)
+    save(args.output, best, args.shooters, args.size)
+
+    print('Scored {} fields in {:.1f}s, kept {} with mean shots to sink from {:.1f} to {:.1f}'.format(
+        args.candidates, time.time() - started, len(best), best[-1][0], best[0][0]))
+
+
+if __name__ == '__main__':
+    main()
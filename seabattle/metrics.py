@@ -0,0 +1,38 @@
+# coding: utf-8
+
+import collections
+import threading
+
+
+_lock = threading.Lock()
+_counters = collections.Counter()
+_timings = {}
+
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, seconds):
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {'count': 0, 'total': 0.0, 'max': 0.0}
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['max'] = max(timing['max'], seconds)
+
+
+def snapshot():
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'timings': {name: dict(timing) for name, timing in _timings.items()},
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timings.clear()
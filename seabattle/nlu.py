@@ -0,0 +1,499 @@
+# coding: utf-8
+
+import array
+import bisect
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import queue
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+
+from seabattle import game
+
+
+log = logging.getLogger(__name__)
+
+BACKEND = os.environ.get('SEABATTLE_NLU', 'rasa')
+BATCH_SIZE = int(os.environ.get('SEABATTLE_NLU_BATCH_SIZE', 1))
+BATCH_WAIT = float(os.environ.get('SEABATTLE_NLU_BATCH_WAIT_MS', 3)) / 1000
+# longest wait for a batched parse when the caller has no deadline
+BATCH_TIMEOUT = float(os.environ.get('SEABATTLE_NLU_BATCH_TIMEOUT_MS', 1000)) / 1000
+INTENTS_PATH = 'config/intents_config.json'
+MODEL_PATH = 'mldata/'
+NGRAM_MODEL_FILE = 'ngram_model.bin'
+NGRAM_MODEL_PATH = os.path.join(MODEL_PATH, NGRAM_MODEL_FILE)
+
+
+# magic, version, intents, features, metadata length
+_NGRAM_HEADER = struct.Struct('=4sIIIQ')
+_NGRAM_MAGIC = b'SBNG'
+_NGRAM_VERSION = 1
+
+
+def dataset_hash(path=INTENTS_PATH):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load_examples(path=INTENTS_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['rasa_nlu_data']['common_examples']
+
+
+class NLUTimeout(Exception):
+    pass
+
+
+class NLUBackend(object):
+    """
+    Turns an utterance into a rasa-like parse result:
+    {'intent': {'name': ..., 'confidence': ...}, 'entities': [{'entity': ..., 'value': ...}, ...]}
+
+    `deadline` is a time.monotonic() value. Backends which wait for others to parse the
+    message raise NLUTimeout when it passes, the rest ignore it.
+    """
+    name = None
+
+    def parse(self, message, deadline=None):
+        raise NotImplementedError()
+
+    def parse_batch(self, messages):
+        return [self.parse(message) for message in messages]
+
+
+class RasaBackend(NLUBackend):
+    """
+    Uses separate intent and entity models written by `seabattle.train` when they exist,
+    otherwise the latest model trained with `rasa_nlu.train`.
+
+    The two models are served as one pipeline: a message goes through the intent model,
+    then through the entity model without its spaCy and tokenizer steps, which reuse the
+    doc and tokens already on the message.
+    """
+    name = 'rasa'
+
+    def __init__(self, model_path=MODEL_PATH):
+        intent_path = os.path.join(model_path, 'default', 'intent')
+        entity_path = os.path.join(model_path, 'default', 'entity')
+
+        if os.path.isdir(intent_path) and os.path.isdir(entity_path):
+            from rasa_nlu.components import ComponentBuilder
+            from rasa_nlu.model import Interpreter
+            from rasa_nlu.training_data import Message
+
+            from seabattle import train
+
+            # cached builder lets both models share one loaded spaCy model
+            builder = ComponentBuilder(use_cache=True)
+            self.intent_interpreter = Interpreter.load(intent_path, builder)
+            self.entity_interpreter = Interpreter.load(entity_path, builder)
+            self.entity_tail = [c for c in self.entity_interpreter.pipeline
+                                if c.name not in train.SHARED_COMPONENTS]
+            self.message_class = Message
+            self.router = None
+        else:
+            from rasa_nlu.data_router import DataRouter
+
+            self.router = DataRouter(model_path)
+
+    def parse(self, message, deadline=None):
+        if self.router is None:
+            return self._parse_models(message)
+
+        data = self.router.extract({'q': message})
+        return self.router.parse(data)
+
+    def _parse_models(self, text):
+        interpreter = self.intent_interpreter
+        response = interpreter.default_output_attributes()
+        response['text'] = text
+        if not text:
+            return response
+
+        message = self.message_class(text, interpreter.default_output_attributes())
+        for component in interpreter.pipeline:
+            component.process(message, **interpreter.context)
+        for component in self.entity_tail:
+            component.process(message, **self.entity_interpreter.context)
+        response.update(message.as_dict(only_output_properties=True))
+        return response
+
+
+def feature_key(feature):
+    """64-bit key of an n-gram, both halves are computed in C."""
+    data = feature.encode('utf-8')
+    return zlib.crc32(data) << 32 | zlib.adler32(data)
+
+
+def _align(offset):
+    return (offset + 7) // 8 * 8
+
+
+class MappedWeights(object):
+    """
+    Read-only weight rows of the ngram model in a memory-mapped file: sorted feature keys
+    followed by a matrix of rows. Every process mapping the file shares its pages, nothing
+    is parsed at load time.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n_intents, n_features, meta_length = _NGRAM_HEADER.unpack_from(self._mmap)
+        if magic != _NGRAM_MAGIC or version != _NGRAM_VERSION:
+            raise ValueError('%s is not an ngram model' % path)
+
+        offset = _NGRAM_HEADER.size
+        self.meta = json.loads(self._mmap[offset:offset + meta_length].decode('utf-8'))
+        offset = _align(offset + meta_length)
+
+        buffer = memoryview(self._mmap)
+        self.keys = buffer[offset:offset + 8 * n_features].cast('Q')
+        offset += 8 * n_features
+        self.rows = buffer[offset:offset + 8 * n_features * n_intents].cast('d')
+        self.n_intents = n_intents
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, feature, default=None):
+        key = feature_key(feature)
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.rows[i * self.n_intents:(i + 1) * self.n_intents].tolist()
+        return default
+
+    @staticmethod
+    def write(path, weights, n_intents, meta):
+        rows = {}
+        for feature, row in weights.items():
+            key = feature_key(feature)
+            if key in rows:
+                log.warning('Feature key collision, dropping %r', feature)
+                continue
+            rows[key] = row
+
+        keys = array.array('Q', sorted(rows))
+        matrix = array.array('d')
+        for key in keys:
+            matrix.extend(rows[key])
+
+        meta = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        header = _NGRAM_HEADER.pack(_NGRAM_MAGIC, _NGRAM_VERSION, n_intents, len(keys), len(meta))
+
+        # workers may have the old file mapped, so it is replaced rather than rewritten
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(meta)
+            f.write(b'\0' * (_align(len(header) + len(meta)) - len(header) - len(meta)))
+            keys.tofile(f)
+            matrix.tofile(f)
+        os.replace(tmp_path, path)
+
+
+def normalize(text):
+    text = text.lower().replace('ё', 'е')
+    return ' '.join(re.findall(r'\w+', text))
+
+
+class NgramBackend(NLUBackend):
+    """
+    Multinomial logistic regression over character n-grams for intents and
+    rule-based extraction of shot coordinates and opponent names.
+    """
+    name = 'ngram'
+
+    ngram_range = (2, 4)
+    epochs = 40
+    learning_rate = 0.5
+    l2 = 1e-4
+
+    opponent_markers = {'соперник', 'соперница', 'с', 'c', 'против'}
+
+    def __init__(self, examples=None, weights=None, intents=None, synonyms=None):
+        self.weights = weights or {}
+        self.intents = intents or []
+        self.synonyms = synonyms or {}
+        self.coordinate_words = (set(game.NUMBER_WORDS) | set(game.BaseGame.letters_mapping) |
+                                 set(game.BaseGame.str_letters))
+
+        if examples is not None:
+            self.train(examples)
+
+    def features(self, text):
+        text = re.sub(r'\d+', '0', normalize(text))
+        padded = ' %s ' % text
+        feats = set('w:' + w for w in text.split())
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            for i in range(len(padded) - n + 1):
+                feats.add(padded[i:i + n])
+        return feats
+
+    def _scores(self, feats, weights=None):
+        weights = self.weights if weights is None else weights
+        scale = 1.0 / math.sqrt(len(feats) or 1)
+        scores = [0.0] * len(self.intents)
+        for f in feats:
+            row = weights.get(f)
+            if row is not None:
+                for i, w in enumerate(row):
+                    scores[i] += w * scale
+        return scores
+
+    @staticmethod
+    def _softmax(scores):
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def train(self, examples):
+        self.intents = sorted(set(e['intent'] for e in examples))
+        intent_index = {name: i for i, name in enumerate(self.intents)}
+        data = [(self.features(e['text']), intent_index[e['intent']]) for e in examples]
+        self.weights = {}
+
+        for e in examples:
+            for entity in e['entities']:
+                if entity['entity'] == 'opponent_entity':
+                    surface = normalize(e['text'][entity['start']:entity['end']])
+                    self.synonyms[surface] = entity['value']
+
+        rng = random.Random(0)
+        n_intents = len(self.intents)
+        for epoch in range(self.epochs):
+            rng.shuffle(data)
+            rate = self.learning_rate / (1 + epoch * 0.1)
+            for feats, label in data:
+                probs = self._softmax(self._scores(feats))
+                scale = rate / math.sqrt(len(feats) or 1)
+                for f in feats:
+                    row = self.weights.get(f)
+                    if row is None:
+                        row = self.weights[f] = [0.0] * n_intents
+                    for i in range(n_intents):
+                        target = 1.0 if i == label else 0.0
+                        row[i] -= scale * (probs[i] - target) + rate * self.l2 * row[i]
+
+    def _find_hit(self, text):
+        tokens = [(m.group(), m.start(), m.end()) for m in re.finditer(r'\w+', text.lower())]
+
+        def _is_coordinate(token):
+            # one letter words like "я" or "с" are not columns
+            return token.isdigit() or token in self.coordinate_words
+
+        for i in reversed(range(len(tokens) - 1)):
+            if _is_coordinate(tokens[i][0]) and _is_coordinate(tokens[i + 1][0]):
+                # numerals of big boards take several words: "двадцать один тридцать пять"
+                first = i
+                while first > 0 and tokens[first - 1][0] in game.NUMBER_WORDS:
+                    first -= 1
+                words = tokens[first:i + 2]
+                return {
+                    'entity': 'hit_entity',
+                    'value': ' '.join(w for w, _, _ in words),
+                    'start': words[0][1],
+                    'end': words[-1][2],
+                }
+        return None
+
+    def _find_opponent(self, text):
+        tokens = [(m.group(), m.start(), m.end()) for m in re.finditer(r'\w+', text.lower())]
+        for (marker, _, _), (name, start, end) in zip(tokens, tokens[1:]):
+            if marker in self.opponent_markers:
+                value = self.synonyms.get(name, name)
+                return {'entity': 'opponent_entity', 'value': value, 'start': start, 'end': end}
+        return None
+
+    def parse(self, message, deadline=None):
+        return self.parse_batch([message])[0]
+
+    def parse_batch(self, messages):
+        batch_feats = [self.features(message) for message in messages]
+
+        # every weight row is looked up once per batch
+        rows = {}
+        for feats in batch_feats:
+            for f in feats:
+                if f not in rows:
+                    rows[f] = self.weights.get(f)
+
+        return [self._build_result(message, self._softmax(self._scores(feats, rows)))
+                for message, feats in zip(messages, batch_feats)]
+
+    def _build_result(self, message, probs):
+        best = max(range(len(probs)), key=probs.__getitem__)
+        intent = self.intents[best]
+
+        entities = []
+        if intent == 'miss':
+            entity = self._find_hit(message)
+        elif intent in ('newgame', 'resumegame'):
+            entity = self._find_opponent(message)
+        else:
+            entity = None
+        if entity is not None:
+            entity['extractor'] = self.name
+            entities.append(entity)
+
+        return {
+            'text': message,
+            'intent': {'name': intent, 'confidence': probs[best]},
+            'entities': entities,
+        }
+
+    def save(self, path, data_hash):
+        MappedWeights.write(path, self.weights, len(self.intents), {
+            'data_hash': data_hash,
+            'intents': self.intents,
+            'synonyms': self.synonyms,
+        })
+
+    @classmethod
+    def load(cls, path=NGRAM_MODEL_PATH, intents_path=INTENTS_PATH):
+        """
+        Map the model cached in `path`, retraining it if the intents dataset has changed.
+        The weights stay in the file, processes loading it share one copy in memory.
+        """
+        data_hash = dataset_hash(intents_path)
+
+        try:
+            weights = MappedWeights(path)
+        except (OSError, ValueError):
+            weights = None
+
+        if weights is None or weights.meta['data_hash'] != data_hash:
+            backend = cls(load_examples(intents_path))
+            try:
+                backend.save(path, data_hash)
+                weights = MappedWeights(path)
+            except OSError:
+                log.warning('Can\'t cache ngram model in %s', path)
+                return backend
+
+        return cls(weights=weights, intents=weights.meta['intents'], synonyms=weights.meta['synonyms'])
+
+    @staticmethod
+    def is_cached(path=NGRAM_MODEL_PATH, intents_path=INTENTS_PATH):
+        """Whether `path` holds a model trained on the current intents dataset."""
+        try:
+            return MappedWeights(path).meta['data_hash'] == dataset_hash(intents_path)
+        except (OSError, ValueError):
+            return False
+
+
+class _BatchRequest(object):
+    def __init__(self, message):
+        self.message = message
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self.done = threading.Event()
+
+
+class BatchingBackend(NLUBackend):
+    """
+    Groups messages parsed concurrently by several threads into a single `parse_batch`
+    call of the wrapped backend. A batch is flushed when it has `max_batch` messages
+    or `max_wait` seconds after its first message has arrived.
+
+    Only backends with their own `parse_batch` gain from it, see `load_backend`.
+    """
+
+    def __init__(self, backend, max_batch=BATCH_SIZE, max_wait=BATCH_WAIT):
+        self.backend = backend
+        self.name = backend.name
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        self._queue = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        # started on first use and again in a forked child, where the parent's thread is gone
+        if self._worker_pid != os.getpid():
+            with self._lock:
+                if self._worker_pid != os.getpid():
+                    self._queue = queue.Queue()
+                    worker = threading.Thread(target=self._run, args=(self._queue,), name='nlu-batching')
+                    worker.daemon = True
+                    worker.start()
+                    self._worker_pid = os.getpid()
+
+    def parse(self, message, deadline=None):
+        self._ensure_worker()
+        request = _BatchRequest(message)
+        self._queue.put(request)
+        timeout = BATCH_TIMEOUT if deadline is None else deadline - time.monotonic()
+        if not request.done.wait(max(timeout, 0)):
+            # the worker skips it, if it ever gets there
+            request.cancelled = True
+            raise NLUTimeout('No batched parse of %r in time' % message)
+
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def parse_batch(self, messages):
+        return self.backend.parse_batch(messages)
+
+    def _collect(self, requests):
+        batch = [requests.get()]
+        flush_at = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            timeout = flush_at - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self, requests):
+        while True:
+            batch = [request for request in self._collect(requests) if not request.cancelled]
+            if not batch:
+                continue
+            try:
+                results = self.backend.parse_batch([request.message for request in batch])
+            except Exception as e:
+                log.exception('NLU batch of %d failed', len(batch))
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+
+            for request, result in zip(batch, results):
+                request.result = result
+                request.done.set()
+
+
+BACKENDS = {
+    'rasa': RasaBackend,
+    'ngram': NgramBackend.load,
+}
+
+
+def load_backend(name=None, batch_size=BATCH_SIZE):
+    backend = BACKENDS[name or BACKEND]()
+    if batch_size > 1:
+        if type(backend).parse_batch is NLUBackend.parse_batch:
+            # a batch would be parsed message by message, only adding the wait
+            log.warning('%s backend has no batch parse, batching is off', backend.name)
+        else:
+            backend = BatchingBackend(backend, max_batch=batch_size)
+    return backend
@@ -0,0 +1,226 @@
+# coding: utf-8
+
+import argparse
+import collections
+import json
+import logging
+import os
+import random
+import time
+
+from seabattle import nlu
+from seabattle import stats
+from seabattle import train
+
+
+log = logging.getLogger(__name__)
+
+ENTITY_TYPES = ('hit_entity', 'opponent_entity')
+RESULTS_FILE = 'nlu_benchmark.json'
+DEFAULT_PIPELINES = ['ngram', train.CONFIG_PATH]
+
+
+class RasaPipelineBackend(nlu.NLUBackend):
+    """A rasa pipeline from `config_path` trained in memory on `examples`, nothing is persisted."""
+    name = 'rasa'
+
+    def __init__(self, config_path, examples):
+        from rasa_nlu import config as rasa_config
+        from rasa_nlu.model import Trainer
+        from rasa_nlu.training_data import Message
+        from rasa_nlu.training_data import TrainingData
+
+        messages = [Message(e['text'], {'intent': e['intent'], 'entities': e['entities']}) for e in examples]
+        self.interpreter = Trainer(rasa_config.load(config_path)).train(TrainingData(training_examples=messages))
+
+    def parse(self, message, deadline=None):
+        return self.interpreter.parse(message)
+
+
+def train_pipeline(pipeline, examples):
+    """'ngram' is the built-in backend, anything else is a path to a rasa pipeline config."""
+    if pipeline == 'ngram':
+        return nlu.NgramBackend(examples)
+    return RasaPipelineBackend(pipeline, examples)
+
+
+def kfold(examples, folds=5, seed=0):
+    """Split into `folds` (train, test) pairs, examples of every intent are spread over all folds."""
+    by_intent = collections.defaultdict(list)
+    for e in examples:
+        by_intent[e['intent']].append(e)
+
+    rng = random.Random(seed)
+    parts = [[] for _ in range(folds)]
+    i = 0
+    for intent in sorted(by_intent):
+        group = by_intent[intent]
+        rng.shuffle(group)
+        for e in group:
+            parts[i % folds].append(e)
+            i += 1
+
+    return [([e for j, part in enumerate(parts) if j != k for e in part], parts[k]) for k in range(folds)]
+
+
+def _entity_set(entities):
+    return {(e['entity'], e['value'].lower()) for e in entities if e['entity'] in ENTITY_TYPES}
+
+
+def _latency_report(seconds):
+    return {
+        'p50_ms': stats.percentile(seconds, 0.5) * 1000,
+        'p95_ms': stats.percentile(seconds, 0.95) * 1000,
+        'p99_ms': stats.percentile(seconds, 0.99) * 1000,
+        'max_ms': max(seconds) * 1000,
+    }
+
+
+def evaluate(pipeline, examples, folds=5, seed=0):
+    """
+    K-fold evaluation of one pipeline: intent accuracy, entity precision, recall and F1 by type,
+    training time, and parse latency of a freshly trained model (cold: its first parse, first
+    pass over the test fold) against the same model parsing the fold again (warm).
+    """
+    correct = 0
+    counts = {entity: collections.Counter() for entity in ENTITY_TYPES}
+    errors = []
+    train_times = []
+    cold = []
+    first_pass = []
+    warm = []
+
+    for train_examples, test_examples in kfold(examples, folds, seed):
+        started = time.perf_counter()
+        backend = train_pipeline(pipeline, train_examples)
+        train_times.append(time.perf_counter() - started)
+
+        for i, e in enumerate(test_examples):
+            started = time.perf_counter()
+            parsed = backend.parse(e['text'])
+            seconds = time.perf_counter() - started
+            first_pass.append(seconds)
+            if i == 0:
+                cold.append(seconds)
+
+            predicted = parsed['intent']['name']
+            correct += predicted == e['intent']
+            gold_entities = _entity_set(e['entities'])
+            parsed_entities = _entity_set(parsed['entities'])
+            for entity in ENTITY_TYPES:
+                gold = {x for x in gold_entities if x[0] == entity}
+                found = {x for x in parsed_entities if x[0] == entity}
+                counts[entity]['tp'] += len(gold & found)
+                counts[entity]['fp'] += len(found - gold)
+                counts[entity]['fn'] += len(gold - found)
+
+            if predicted != e['intent'] or gold_entities != parsed_entities:
+                errors.append({
+                    'text': e['text'],
+                    'intent': e['intent'],
+                    'predicted': predicted,
+                    'entities': sorted(gold_entities),
+                    'predicted_entities': sorted(parsed_entities),
+                })
+
+        for e in test_examples:
+            started = time.perf_counter()
+            backend.parse(e['text'])
+            warm.append(time.perf_counter() - started)
+
+    entities = {}
+    for entity, c in counts.items():
+        precision = c['tp'] / (c['tp'] + c['fp']) if c['tp'] + c['fp'] else 0.0
+        recall = c['tp'] / (c['tp'] + c['fn']) if c['tp'] + c['fn'] else 0.0
+        entities[entity] = {
+            'precision': precision,
+            'recall': recall,
+            'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+            'support': c['tp'] + c['fn'],
+        }
+
+    return {
+        'pipeline': pipeline,
+        'folds': folds,
+        'examples': len(examples),
+        'intent_accuracy': correct / len(examples),
+        'entities': entities,
+        'train_seconds': sum(train_times) / len(train_times),
+        'cold_first_parse_ms': sum(cold) / len(cold) * 1000,
+        'cold': _latency_report(first_pass),
+        'warm': _latency_report(warm),
+        'errors': errors,
+    }
+
+
+def serving(name, examples):
+    """
+    The deployed backend `name` of nlu.BACKENDS as the service loads it: load time,
+    accuracy on the examples it was trained on, parse latency.
+    """
+    started = time.perf_counter()
+    backend = nlu.load_backend(name, batch_size=1)
+    load_seconds = time.perf_counter() - started
+
+    correct = 0
+    seconds = []
+    for e in examples:
+        started = time.perf_counter()
+        parsed = backend.parse(e['text'])
+        seconds.append(time.perf_counter() - started)
+        correct += parsed['intent']['name'] == e['intent']
+
+    return {
+        'backend': name,
+        'load_ms': load_seconds * 1000,
+        'train_accuracy': correct / len(examples),
+        'latency': _latency_report(seconds),
+    }
+
+
+def run(pipelines, data_path=nlu.INTENTS_PATH, folds=5, seed=0, backends=()):
+    examples = nlu.load_examples(data_path)
+    results = {'data': data_path, 'finished': time.time(), 'pipelines': {}, 'serving': {}}
+    for pipeline in pipelines:
+        log.info('Evaluating %s', pipeline)
+        results['pipelines'][pipeline] = evaluate(pipeline, examples, folds, seed)
+    for name in backends:
+        log.info('Loading %s', name)
+        results['serving'][name] = serving(name, examples)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='K-fold accuracy and latency of NLU pipelines on the intents dataset')
+    parser.add_argument('pipelines', nargs='*', default=DEFAULT_PIPELINES,
+                        help='ngram or paths to rasa pipeline configs')
+    parser.add_argument('--data', default=nlu.INTENTS_PATH)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--serving', nargs='*', default=[], choices=sorted(nlu.BACKENDS),
+                        help='also time the deployed models of these backends')
+    parser.add_argument('--output', default=os.path.join(nlu.MODEL_PATH, RESULTS_FILE))
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+
+    results = run(args.pipelines, args.data, args.folds, args.seed, args.serving)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    print('%-28s %8s %8s %8s %10s %10s %10s %10s' % (
+        'pipeline', 'intent', 'hit F1', 'opp F1', 'train s', 'cold ms', 'p50 ms', 'p95 ms'))
+    for name, r in results['pipelines'].items():
+        print('%-28s %8.3f %8.3f %8.3f %10.2f %10.3f %10.3f %10.3f' % (
+            name, r['intent_accuracy'], r['entities']['hit_entity']['f1'], r['entities']['opponent_entity']['f1'],
+            r['train_seconds'], r['cold_first_parse_ms'], r['warm']['p50_ms'], r['warm']['p95_ms']))
+    if results['serving']:
+        print('%-28s %10s %10s %10s %10s' % ('deployed backend', 'load ms', 'train acc', 'p50 ms', 'p95 ms'))
+        for name, r in results['serving'].items():
+            print('%-28s %10.1f %10.3f %10.3f %10.3f' % (
+                name, r['load_ms'], r['train_accuracy'], r['latency']['p50_ms'], r['latency']['p95_ms']))
+    print('Results: %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
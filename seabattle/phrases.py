@@ -0,0 +1,106 @@
+# coding: utf-8
+
+import argparse
+import functools
+
+from seabattle import game
+
+
+# opponent names kept with their rendered prefixes
+MAX_OPPONENTS = 1024
+
+
+def shot_to_tts(shot):
+    return shot.replace(', ', ' - - - - ')
+
+
+@functools.lru_cache(maxsize=MAX_OPPONENTS)
+def opponent_prefixes(opponent):
+    """(lowercase name, text prefix, tts prefix) of `opponent`."""
+    return opponent.lower(), '%s, ' % opponent, '%s - - ' % opponent
+
+
+def with_opponent(opponent, text, tts=None):
+    """Address the reply to `opponent` unless it already starts with the name."""
+    lowered, text_prefix, tts_prefix = opponent_prefixes(opponent)
+    if text[:len(lowered)].lower() != lowered:
+        text = text_prefix + text
+        if tts:
+            tts = tts_prefix + tts
+    return text, tts
+
+
+class PhraseTable(object):
+    """
+    Text and TTS of every shot reply on a `size`x`size` board, for each cell, template key and
+    both coordinate modes (numbers or letters), rendered once. Replies are looked up by the
+    shot string `Game.do_shot` returns.
+    """
+
+    def __init__(self, size, message_templates, tts_templates, keys):
+        self.size = size
+        self.message_templates = message_templates
+        self.tts_templates = tts_templates
+        self.keys = keys
+
+        board = game.BaseGame()
+        self.positions = {}
+        self.shots = {}
+        for x in range(1, size + 1):
+            for y in range(1, size + 1):
+                for numbers in (True, False):
+                    shot = board.convert_from_position((x, y), numbers=numbers)
+                    for key in keys:
+                        phrase = (shot,) + self.render(key, shot)
+                        self.positions[(x, y), key, numbers] = phrase
+                        self.shots[shot, key] = phrase[1:]
+
+    def render(self, key, shot):
+        response_dict = {'shot': shot, 'tts_shot': shot_to_tts(shot)}
+        return self.message_templates[key] % response_dict, self.tts_templates[key] % response_dict
+
+    def shot_reply(self, key, shot):
+        """(text, tts) of reply `key` with our `shot`."""
+        try:
+            return self.shots[shot, key]
+        except KeyError:
+            return self.render(key, shot)
+
+    def validate(self):
+        """
+        Phrases whose shot doesn't parse back to its cell with `Game.convert_to_position`:
+        a list of (position, key, numbers, shot, parsed position or error).
+        """
+        board = game.BaseGame()
+        board.size = self.size
+        failures = []
+        for (position, key, numbers), (shot, _, _) in sorted(self.positions.items()):
+            try:
+                parsed = board.convert_to_position(shot.replace(',', ''))
+            except ValueError as e:
+                parsed = str(e)
+            if parsed != position:
+                failures.append((position, key, numbers, shot, parsed))
+        return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check every shot phrase parses back to its cell')
+    parser.add_argument('--size', type=int, default=10)
+    parser.add_argument('--letters', action='store_true', help='also check the letters mode')
+    args = parser.parse_args()
+
+    from seabattle import dialog_manager
+
+    table = dialog_manager.get_phrase_table(args.size)
+    checked = [phrase for phrase in table.positions if phrase[2] or args.letters]
+    failures = [f for f in table.validate() if f[2] or args.letters]
+    for position, key, numbers, shot, parsed in failures:
+        print('%s %s %s: %r -> %s' % (position, key, 'numbers' if numbers else 'letters', shot, parsed))
+    print('%d phrases, %d don\'t round-trip' % (len(checked), len(failures)))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# coding: utf-8
+
+import collections
+import functools
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+# share of decorated calls profiled, 0 turns sampling off
+PROFILE_RATE = float(os.environ.get('SEABATTLE_PROFILE_RATE', 0))
+PROFILE_DIR = os.environ.get('SEABATTLE_PROFILE_DIR', 'profiles/')
+PROFILE_INTERVAL = float(os.environ.get('SEABATTLE_PROFILE_INTERVAL_MS', 1)) / 1000
+# value of the X-Seabattle-Profile header which profiles a request, empty ignores the header
+PROFILE_SECRET = os.environ.get('SEABATTLE_PROFILE_SECRET', '')
+
+_local = threading.local()
+# separate generator, so sampling doesn't change the games played with a fixed seed
+_random = random.Random()
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+def _stack(frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+def header_allows(value, secret=None):
+    """
+    Whether a request header `value` carries `secret`, PROFILE_SECRET by default, so the
+    request may be profiled. An empty secret allows nothing.
+    """
+    secret = PROFILE_SECRET if secret is None else secret
+    if not secret or not value:
+        return False
+    return hmac.compare_digest(value.encode('utf-8'), secret.encode('utf-8'))
+
+
+class Profiler(object):
+    """
+    Sampling profiler for the code run by the current thread inside the `with` block.
+    Another thread takes the stack of the profiled one every `interval` seconds, the
+    samples are written to `path` as collapsed stacks, ready for flamegraph.pl or speedscope.
+
+    Nested profilers of the same thread do nothing, so the outermost one gets all samples.
+    """
+
+    def __init__(self, name, enabled=True, path=None, interval=None):
+        self.name = name
+        self.enabled = enabled
+        self.path = path or PROFILE_DIR
+        self.interval = interval or PROFILE_INTERVAL
+        self.stacks = collections.Counter()
+        self.filename = None
+        self._sampler = None
+
+    def __enter__(self):
+        if not self.enabled or getattr(_local, 'active', False):
+            return self
+        _local.active = True
+
+        # frames above the profiled block are the same in every sample
+        self._skip = len(_stack(sys._getframe(1))) - 1
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._started = time.time()
+        self._sampler = threading.Thread(target=self._run, name='profiler-%s' % self.name)
+        self._sampler.daemon = True
+        self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._sampler is None:
+            return False
+
+        self._stop.set()
+        self._sampler.join()
+        self._sampler = None
+        _local.active = False
+
+        try:
+            self.save(time.time() - self._started)
+        except OSError:
+            log.warning('Can\'t save profile to %s', self.path)
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.stacks[';'.join(_stack(frame)[self._skip:])] += 1
+
+    def save(self, seconds):
+        os.makedirs(self.path, exist_ok=True)
+        self.filename = os.path.join(self.path, '%s-%d-%d.folded' % (
+            re.sub(r'[^\w.-]', '_', self.name), time.time() * 1000, self._thread_id))
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write('%s %d\n' % (stack, count))
+        log.info('Profile of %s: %.1f ms, %d samples in %s',
+                 self.name, seconds * 1000, sum(self.stacks.values()), self.filename)
+
+
+def should_sample(rate=None):
+    rate = PROFILE_RATE if rate is None else rate
+    return rate > 0 and _random.random() < rate
+
+
+def profiled(name):
+    """Profile a `PROFILE_RATE` share of calls of the decorated function."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILE_RATE:
+                return func(*args, **kwargs)
+            with Profiler(name, should_sample()):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
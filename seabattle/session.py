@@ -1,9 +1,57 @@
 # coding: utf-8
 
-from __future__ import unicode_literals
+import contextlib
+import os
+import pickle
+import threading
+import time
+import zlib
 
+from seabattle import metrics
+
+# parked games kept per user, the least recently parked are dropped
+MAX_GAMES = int(os.environ.get('SEABATTLE_MAX_GAMES', 10))
+# users share these locks by hash of user id, only users on one lock wait for each other
+LOCK_STRIPES = int(os.environ.get('SEABATTLE_SESSION_LOCKS', 256))
 
 _sessions = {}
+_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+class GameRegistry(object):
+    """
+    Games of one user by opponent, other than the active one. A parked game is kept as
+    compressed pickle of its state and is only unpickled when the user gets back to it.
+    """
+
+    def __init__(self, max_games=MAX_GAMES):
+        self.max_games = max_games
+        self._snapshots = {}
+
+    def __contains__(self, opponent):
+        return opponent in self._snapshots
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def opponents(self):
+        return list(self._snapshots)
+
+    def size(self):
+        return sum(len(data) for data in self._snapshots.values())
+
+    def park(self, opponent, state):
+        self._snapshots.pop(opponent, None)
+        self._snapshots[opponent] = zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+        while len(self._snapshots) > self.max_games:
+            del self._snapshots[next(iter(self._snapshots))]
+
+    def take(self, opponent):
+        """Remove the game with `opponent` from the registry and return its state."""
+        return pickle.loads(zlib.decompress(self._snapshots.pop(opponent)))
+
+    def discard(self, opponent):
+        self._snapshots.pop(opponent, None)
 
 
 def get(user_id):
@@ -13,6 +61,65 @@ def get(user_id):
             'game': None,
             'last': None,
             'opponent': None,
+            'stats': None,
+            'games': GameRegistry(),
         }
         _sessions[user_id] = session_obj
     return session_obj
+
+
+def _lock_for(user_id):
+    return _locks[hash(user_id) % len(_locks)]
+
+
+@contextlib.contextmanager
+def locked(user_id):
+    """
+    Session of `user_id` for the duration of the block. Requests of one user are handled
+    one at a time, so they don't change the same game at once. Time spent waiting for
+    the lock goes to the `session_lock_wait` timing.
+    """
+    lock = _lock_for(user_id)
+    if lock.acquire(blocking=False):
+        metrics.observe('session_lock_wait', 0.0)
+    else:
+        metrics.incr('session_lock_contended')
+        started = time.monotonic()
+        lock.acquire()
+        metrics.observe('session_lock_wait', time.monotonic() - started)
+    try:
+        yield get(user_id)
+    finally:
+        lock.release()
+
+
+def _registry(session_obj):
+    if session_obj.get('games') is None:
+        session_obj['games'] = GameRegistry()
+    return session_obj['games']
+
+
+def park_game(session_obj):
+    """Move the active game to the registry, the session is left without a game."""
+    if session_obj['game'] is not None:
+        _registry(session_obj).park(session_obj['opponent'], {
+            'game': session_obj['game'],
+            'last': session_obj['last'],
+            'stats': session_obj.get('stats'),
+        })
+    session_obj['game'] = session_obj['last'] = session_obj['stats'] = None
+
+
+def resume_game(session_obj, opponent):
+    """Make the game with `opponent` active, parking the current one. False if there is no such game."""
+    if session_obj['game'] is not None and session_obj['opponent'] == opponent:
+        return True
+
+    registry = _registry(session_obj)
+    if opponent not in registry:
+        return False
+
+    park_game(session_obj)
+    session_obj.update(registry.take(opponent))
+    session_obj['opponent'] = opponent
+    return True
@@ -1,82 +1,232 @@
 # coding: utf-8
-import sys
+
+import argparse
 import importlib
 import logging
+import math
+import random
+import time
 
+from seabattle import game as gm
+from seabattle import profiling
+from seabattle import strategies
 
-logging.basicConfig(format='%(message)s', level=logging.INFO)
-
-
-player_1 = importlib.import_module(sys.argv[1])
-player_2 = importlib.import_module(sys.argv[2])
-
-game_1 = player_1.Game()
-game_2 = player_2.Game()
 
-game_1.start_new_game()
-game_2.start_new_game()
+log = logging.getLogger(__name__)
 
-print 'Player 1 field:'
-game_1.print_field()
-print 'Player 2 field:'
-game_2.print_field()
 
-
-def get_name(game):
-    if game is game_1:
-        return 'Player 1'
-    else:
-        return 'Player 2'
+def load_game_class(name):
+    """
+    Game class of module `name`, e.g. seabattle.game, or the Game playing strategy `name`,
+    a registered one like montecarlo or module:Class.
+    """
+    if ':' in name or name in strategies.names():
+        return strategies.game_class(name)
+    return importlib.import_module(name).Game
 
 
 def prepare_text_coords(coords):
     return coords.replace(',', '')
 
 
-active = game_1
-passive = game_2
-
-
-# MAIN LOOP
-while True:
-    coords = active.convert_to_position(prepare_text_coords(active.do_shot()))
-    print '{}: MOVE {}-{}'.format(get_name(active), coords[0], coords[1])
-    result = passive.handle_enemy_shot(coords)
-    print '{}: {}'.format(get_name(passive), result.upper())
-    active.handle_enemy_reply(result)
-
-    if result == 'miss':
-        active, passive = passive, active
-
-    should_exit = False
-
-    if game_1.is_victory():
-        print 'Player 1: VICTORY'
-        should_exit = True
-    elif game_1.is_defeat():
-        print 'Player 1: DEFEAT'
-        should_exit = True
-
-    if game_2.is_victory():
-        print 'Player 2: VICTORY'
-        should_exit = True
-    elif game_2.is_defeat():
-        print 'Player 2: DEFEAT'
-        should_exit = True
-
-    if should_exit:
-        break
-
+def play(first, second, names=None, verbose=False):
+    """Play one game until someone wins. `first` moves first, the winner is returned."""
+    names = names or {first: 'Player 1', second: 'Player 2'}
+    active, passive = first, second
+
+    while True:
+        coords = active.convert_to_position(prepare_text_coords(active.do_shot()))
+        result = passive.handle_enemy_shot(coords)
+        active.handle_enemy_reply(result)
+
+        if verbose:
+            print('{}: MOVE {}-{}'.format(names[active], coords[0], coords[1]))
+            print('{}: {}'.format(names[passive], result.upper()))
+
+        if passive.is_defeat() or active.is_victory():
+            if verbose:
+                print('{}: VICTORY'.format(names[active]))
+                print('{}: DEFEAT'.format(names[passive]))
+            return active
+
+        if result == 'miss':
+            active, passive = passive, active
+
+
+def generate_field(size=10, ships=None, layouts=''):
+    """A uniformly random field, or one from the pool in `layouts` if it is given."""
+    field_game = gm.Game()
+    field_game.start_new_game(size, ships=ships, layouts=layouts)
+    return field_game.field
+
+
+def play_mirrored_pair(game_cls_1, game_cls_2, size=10, ships=None, layouts=''):
+    """
+    Play two games on the same pair of fields: players swap the fields they defend
+    and who moves first, so neither layout luck nor the first move favours anyone.
+
+    Returns the list of results from the first player's point of view (True is a win).
+    """
+    field_a = generate_field(size, ships, layouts)
+    field_b = generate_field(size, ships, layouts)
+
+    results = []
+    for field_1, field_2, player_1_first in ((field_a, field_b, True), (field_b, field_a, False)):
+        game_1 = game_cls_1()
+        game_1.start_new_game(size, list(field_1), ships, numbers=True)
+        game_2 = game_cls_2()
+        game_2.start_new_game(size, list(field_2), ships, numbers=True)
+
+        if player_1_first:
+            winner = play(game_1, game_2)
+        else:
+            winner = play(game_2, game_1)
+        results.append(winner is game_1)
+
+    return results
+
+
+class SPRT(object):
+    """
+    Wald's sequential probability ratio test for the first player's win rate.
+
+    H0: p = 0.5 - delta (second player is stronger), H1: p = 0.5 + delta (first player
+    is stronger). `alpha` and `beta` are the error rates of accepting H1 and H0 wrongly.
+    """
+
+    def __init__(self, delta=0.05, alpha=0.05, beta=0.05):
+        assert 0 < delta < 0.5
+        self.p0 = 0.5 - delta
+        self.p1 = 0.5 + delta
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+
+        self.win_llr = math.log(self.p1 / self.p0)
+        self.loss_llr = math.log((1 - self.p1) / (1 - self.p0))
+
+        self.llr = 0.0
+        self.wins = 0
+        self.losses = 0
+
+    @property
+    def games(self):
+        return self.wins + self.losses
+
+    def update(self, won):
+        if won:
+            self.wins += 1
+            self.llr += self.win_llr
+        else:
+            self.losses += 1
+            self.llr += self.loss_llr
+
+    def decision(self):
+        if self.llr >= self.upper:
+            return 'H1'
+        elif self.llr <= self.lower:
+            return 'H0'
+        return None
+
+
+def evaluate(game_cls_1, game_cls_2, delta=0.05, alpha=0.05, beta=0.05, max_games=10000, size=10, ships=None,
+             profile=None, profile_every=10, layouts=''):
+    """With `profile` set, a profile of every `profile_every` games is written to that directory."""
+    sprt = SPRT(delta, alpha, beta)
+    cpu_started = time.process_time()
+    wall_started = time.time()
+
+    while sprt.games < max_games and sprt.decision() is None:
+        with profiling.Profiler('games-%d' % sprt.games, enabled=profile is not None, path=profile):
+            block_end = min(max_games, sprt.games + profile_every)
+            while sprt.games < block_end and sprt.decision() is None:
+                for won in play_mirrored_pair(game_cls_1, game_cls_2, size, ships, layouts):
+                    sprt.update(won)
+
+    return {
+        'decision': sprt.decision(),
+        'games': sprt.games,
+        'wins': sprt.wins,
+        'losses': sprt.losses,
+        'llr': sprt.llr,
+        'bounds': (sprt.lower, sprt.upper),
+        'cpu_time': time.process_time() - cpu_started,
+        'wall_time': time.time() - wall_started,
+    }
+
+
+def print_evaluation(result):
+    verdicts = {
+        'H1': 'Player 1 is stronger',
+        'H0': 'Player 2 is stronger',
+        None: 'Inconclusive, max games reached',
+    }
+    print(verdicts[result['decision']])
+    print('Games: {games} (player 1: {wins} wins, {losses} losses)'.format(**result))
+    print('LLR: {:.3f} in ({:.3f}, {:.3f})'.format(result['llr'], *result['bounds']))
+    print('CPU time: {cpu_time:.2f}s, wall time: {wall_time:.2f}s'.format(**result))
+
+
+def simulate(game_cls_1, game_cls_2, profile=None, layouts=''):
+    game_1 = game_cls_1()
+    game_2 = game_cls_2()
+
+    game_1.start_new_game(numbers=True, layouts=layouts)
+    game_2.start_new_game(numbers=True, layouts=layouts)
+
+    print('Player 1 field:')
+    game_1.print_field()
+    print('Player 2 field:')
+    game_2.print_field()
+
+    with profiling.Profiler('game', enabled=profile is not None, path=profile):
+        play(game_1, game_2, verbose=True)
+
+    print('=' * 50)
+    print('Player 1 field:')
+    print('His POV:')
+    game_1.print_field()
+    print('Opponents POV:')
+    game_2.print_enemy_field()
+
+    print('Player 2 field:')
+    print('His POV:')
+    game_2.print_field()
+    print('Opponents POV:')
+    game_1.print_enemy_field()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play Game implementations against each other')
+    parser.add_argument('player_1', help='strategy or module with the first Game implementation')
+    parser.add_argument('player_2', help='strategy or module with the second Game implementation')
+    parser.add_argument('--evaluate', action='store_true',
+                        help='play mirrored games until SPRT decides which player is stronger')
+    parser.add_argument('--delta', type=float, default=0.05,
+                        help='win rate difference from 0.5 the test should detect')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--max-games', type=int, default=10000)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--layouts', default='', metavar='PATH',
+                        help='draw fields from this pool of seabattle.layouts, uniformly random by default')
+    parser.add_argument('--profile', metavar='DIR', help='write collapsed stack profiles of the games to DIR')
+    parser.add_argument('--profile-every', type=int, default=10, help='games in every profile of --evaluate')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    game_cls_1 = load_game_class(args.player_1)
+    game_cls_2 = load_game_class(args.player_2)
+
+    if args.evaluate:
+        logging.basicConfig(format='%(message)s', level=logging.WARNING)
+        print_evaluation(evaluate(game_cls_1, game_cls_2, args.delta, args.alpha, args.beta, args.max_games,
+                                  profile=args.profile, profile_every=args.profile_every, layouts=args.layouts))
+    else:
+        logging.basicConfig(format='%(message)s', level=logging.INFO)
+        simulate(game_cls_1, game_cls_2, args.profile, args.layouts)
 
-print '=' * 50
-print 'Player 1 field:'
-print 'His POV:'
-game_1.print_field()
-print 'Opponents POV:'
-game_2.print_enemy_field()
 
-print 'Player 2 field:'
-print 'His POV:'
-game_2.print_field()
-print 'Opponents POV:'
-game_1.print_enemy_field()
+if __name__ == '__main__':
+    main()
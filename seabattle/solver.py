@@ -0,0 +1,276 @@
+# coding: utf-8
+
+import functools
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+
+from seabattle import game as gm
+from seabattle import metrics
+from seabattle import strategies
+
+
+log = logging.getLogger(__name__)
+
+# time for one target mode shot, the game deadline shortens it further
+SOLVER_BUDGET = float(os.environ.get('SEABATTLE_SOLVER_BUDGET_MS', 20)) / 1000
+# extra processes sampling layouts, 0 samples in the calling thread only
+SOLVER_PROCESSES = int(os.environ.get('SEABATTLE_SOLVER_PROCESSES', 0))
+
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def start_pool():
+    """
+    Start the SOLVER_PROCESSES sampling processes of this process, if any. Call it at startup,
+    before request threads run: a fork copies the locks those threads hold.
+    """
+    global _pool, _pool_size
+    with _pool_lock:
+        if SOLVER_PROCESSES > 0 and _pool is None:
+            _pool = multiprocessing.Pool(SOLVER_PROCESSES)
+            _pool_size = SOLVER_PROCESSES
+    return _pool
+
+
+def get_pool():
+    """The pool of start_pool, None if it hasn't been started: shots sample in their own thread then."""
+    return _pool
+
+
+def _neighbours(cells, size):
+    result = set()
+    for index in cells:
+        x, y = index % size, index // size
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < size and 0 <= ny < size:
+                    result.add(ny * size + nx)
+    return result - set(cells)
+
+
+def covering_placements(field, size, hits, lengths):
+    """
+    Every placement of a ship of one of `lengths` over a hit which is allowed by the field:
+    its cells are EMPTY or hits, and no hit touches it from outside, as ships don't touch.
+
+    Returns {hit: [(length, cells, cells with neighbours), ...]}.
+    """
+    placements = {}
+    for hit in hits:
+        hx, hy = hit % size, hit // size
+        options = []
+        for length in lengths:
+            for step, start_range in ((1, range(hx - length + 1, hx + 1)), (size, range(hy - length + 1, hy + 1))):
+                for start in start_range:
+                    if start < 0 or start + length > size:
+                        continue
+                    first = hy * size + start if step == 1 else start * size + hx
+                    cells = frozenset(first + step * i for i in range(length))
+                    if any(field[c] != gm.EMPTY and c not in hits for c in cells):
+                        continue
+                    ring = _neighbours(cells, size)
+                    if ring & hits:
+                        continue
+                    options.append((length, cells, cells | ring))
+        placements[hit] = options
+    return placements
+
+
+def _box(size, x0, y0, x1, y1):
+    """Bitmask of the cells from (x0, y0) to (x1, y1) clipped to the board."""
+    x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, size - 1), min(y1, size - 1)
+    row = ((1 << (x1 - x0 + 1)) - 1) << x0
+    return sum(row << (y * size) for y in range(y0, y1 + 1))
+
+
+@functools.lru_cache(maxsize=64)
+def _board_placements(size, length):
+    """Every placement of a ship of `length` on an empty board, as bitmasks (cells, cells with neighbours)."""
+    options = []
+    for y in range(size):
+        for x in range(size):
+            if x + length <= size:
+                options.append((_box(size, x, y, x + length - 1, y), _box(size, x - 1, y - 1, x + length, y + 1)))
+            if length > 1 and y + length <= size:
+                options.append((_box(size, x, y, x, y + length - 1), _box(size, x - 1, y - 1, x + 1, y + length)))
+    return options
+
+
+def free_placements(field, size, lengths):
+    """Placements of ships of `lengths` on EMPTY cells of `field`: {length: [(cells, cells with neighbours)]}."""
+    empty = sum(1 << i for i, v in enumerate(field) if v == gm.EMPTY)
+    return {length: [p for p in _board_placements(size, length) if p[0] & empty == p[0]] for length in lengths}
+
+
+def _fits(placements, lengths, forbidden, rng):
+    """Whether ships of `lengths` fit outside the `forbidden` bitmask without touching, tried once from random starts."""
+    for length in sorted(lengths, reverse=True):
+        options = placements[length]
+        if not options:
+            return False
+        start = rng.randrange(len(options))
+        for i in range(len(options)):
+            cells, area = options[(start + i) % len(options)]
+            if not cells & forbidden:
+                forbidden |= area
+                break
+        else:
+            return False
+    return True
+
+
+def sample_counts(field, size, hits, fleet, deadline, max_samples=5000, seed=None):
+    """
+    Sample layouts of the damaged ships until time.monotonic() `deadline`: ships from the
+    remaining `fleet` which cover all `hits` without touching each other. A sample counts
+    only if the rest of the fleet still fits on the EMPTY cells around them, checked with
+    one random placement, so a few consistent layouts are rejected too.
+
+    Returns ({EMPTY cell: samples it is a ship in}, samples).
+    """
+    rng = random.Random(seed)
+    hits = frozenset(hits)
+    placements = covering_placements(field, size, hits, sorted(set(fleet)))
+    free = free_placements(field, size, sorted(set(fleet)))
+
+    counts = {}
+    samples = 0
+    attempts = 0
+    while samples < max_samples and (attempts % 32 or time.monotonic() < deadline):
+        attempts += 1
+        left = list(fleet)
+        uncovered = set(hits)
+        forbidden = set()
+        occupied = []
+
+        while uncovered:
+            hit = rng.choice(sorted(uncovered))
+            # a placement of length present twice in the fleet is twice as likely
+            options = [p for p in placements[hit] if p[0] in left and not (p[1] & forbidden)]
+            weights = [left.count(p[0]) for p in options]
+            if not options:
+                break
+            length, cells, area = rng.choices(options, weights)[0]
+            left.remove(length)
+            uncovered -= cells
+            forbidden |= area
+            occupied.extend(cells)
+        else:
+            if not _fits(free, left, sum(1 << c for c in forbidden), rng):
+                continue
+            samples += 1
+            for cell in occupied:
+                if cell not in hits:
+                    counts[cell] = counts.get(cell, 0) + 1
+
+    return counts, samples
+
+
+@strategies.register
+class MonteCarloStrategy(strategies.LinesStrategy):
+    """
+    Target mode picks the cell which is most often a ship in sampled layouts of all
+    damaged ships, consistent with misses, sunk ships and the ships still afloat.
+    Sampling stops after `budget` seconds or before the game deadline, whichever is earlier.
+    """
+
+    name = 'montecarlo'
+    budget = SOLVER_BUDGET
+    # enough to rank cells around a few hits, sampling stops earlier
+    max_samples = 2000
+    # left before the deadline for the rest of the reply
+    deadline_margin = 0.005
+
+    def reset(self, game):
+        self.sunk = set()
+        self.sunk_ships = []
+
+    def remaining_fleet(self, game):
+        fleet = list(game.ships)
+        for length in self.sunk_ships:
+            if length in fleet:
+                fleet.remove(length)
+        return fleet
+
+    def unsunk_hits(self, game):
+        return {i for i, v in enumerate(game.enemy_field) if v == gm.SHIP and i not in self.sunk}
+
+    def on_reply(self, game, message):
+        super(MonteCarloStrategy, self).on_reply(game, message)
+        if message != 'kill':
+            return
+
+        # the sunk ship is the line of hits through the last shot
+        cells = set()
+        todo = [game.last_shot_position]
+        while todo:
+            pos = todo.pop()
+            index = game.calc_index(pos)
+            if index in cells or game.enemy_field[index] != gm.SHIP:
+                continue
+            cells.add(index)
+            for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+                neighbour = (pos[0] + dx, pos[1] + dy)
+                if not game.is_point_invalid(neighbour):
+                    todo.append(neighbour)
+        self.sunk |= cells
+        self.sunk_ships.append(len(cells))
+
+        hits = self.unsunk_hits(game)
+        if hits:
+            game.last_shot_damage = game.calc_position(min(hits))
+            self.find_target(game)
+
+    def solver_budget(self, game):
+        time_left = game.time_left()
+        if time_left is None:
+            return self.budget
+        return max(0.0, min(self.budget, time_left - self.deadline_margin))
+
+    def find_target(self, game):
+        hits = self.unsunk_hits(game)
+        if not hits:
+            return game.try_detect_next_ship_cell()
+        budget = self.solver_budget(game)
+        if not budget:
+            # no time left before the deadline, walk along the line like the lines strategy
+            metrics.incr('degraded_shot')
+            return game.try_detect_next_ship_cell()
+
+        field = list(game.enemy_field)
+        fleet = self.remaining_fleet(game)
+        seed = random.getrandbits(32)
+        # monotonic clock is shared by processes, workers stop together with this one
+        deadline = time.monotonic() + budget
+
+        pool = get_pool()
+        pending = None
+        if pool is not None:
+            tasks = [(field, game.size, hits, fleet, deadline, self.max_samples, seed + i + 1)
+                     for i in range(_pool_size)]
+            pending = pool.starmap_async(sample_counts, tasks)
+
+        counts, samples = sample_counts(field, game.size, hits, fleet, deadline, self.max_samples, seed)
+        if pending is not None:
+            try:
+                for worker_counts, worker_samples in pending.get(timeout=self.deadline_margin):
+                    samples += worker_samples
+                    for cell, n in worker_counts.items():
+                        counts[cell] = counts.get(cell, 0) + n
+            except multiprocessing.TimeoutError:
+                log.warning('Solver workers are late, using %d local samples', samples)
+
+        counts = {cell: n for cell, n in counts.items() if game.enemy_field[cell] == gm.EMPTY}
+        if not counts:
+            return game.try_detect_next_ship_cell()
+
+        best = max(counts.values())
+        game.next_shot_index = random.choice(sorted(cell for cell, n in counts.items() if n == best))
+        log.debug('Solver: %d samples, p=%.2f at %s', samples, best / samples, game.calc_position(game.next_shot_index))
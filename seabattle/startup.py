@@ -0,0 +1,136 @@
+# coding: utf-8
+
+import argparse
+import collections
+import gc
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+
+
+log = logging.getLogger(__name__)
+
+# time `import seabattle.api` may take, heavy dependencies must be imported on first use
+IMPORT_BUDGET = float(os.environ.get('SEABATTLE_IMPORT_BUDGET_MS', 500)) / 1000
+WARMUP_MESSAGES = ['новая игра', 'начинай', 'мимо. я хожу 5 5']
+
+_importtime_line = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+ImportTime = collections.namedtuple('ImportTime', ['module', 'self', 'cumulative', 'depth'])
+
+
+def parse_importtime(text):
+    """Parse stderr of `python -X importtime` into ImportTime records, times in seconds."""
+    records = []
+    for line in text.splitlines():
+        match = _importtime_line.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        records.append(ImportTime(module, int(self_us) / 1e6, int(cumulative_us) / 1e6, (len(indent) - 1) // 2))
+    return records
+
+
+def measure_imports(module='seabattle.api', python=None):
+    """Import `module` in a fresh interpreter and return its ImportTime records."""
+    result = subprocess.run(
+        [python or sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+    )
+    if result.returncode:
+        raise RuntimeError('Can\'t import %s:\n%s' % (module, result.stderr))
+    return parse_importtime(result.stderr)
+
+
+def report_by_package(records):
+    """Self import time summed per top level package, the slowest first."""
+    totals = collections.Counter()
+    for record in records:
+        totals[record.module.split('.')[0]] += record.self
+    return totals.most_common()
+
+
+def preload(messages=None):
+    """
+    Load what forked workers can share: the mmapped ngram model with a few parses, a game
+    with a shot, shot phrases. Run in a parent process before forking, workers get the
+    loaded pages copy-on-write. The NLU model itself is loaded by `warmup` after fork,
+    TensorFlow sessions and their threads don't survive it.
+    """
+    from seabattle import dialog_manager as dm
+    from seabattle import game as gm
+
+    started = time.monotonic()
+    fallback = dm.get_fallback_backend()
+    for message in messages or WARMUP_MESSAGES:
+        fallback.parse(message)
+
+    g = gm.Game()
+    g.start_new_game(numbers=True)
+    g.do_shot()
+    dm.get_phrase_table(g.size)
+
+    seconds = time.monotonic() - started
+    log.info('Preloaded in %.3fs', seconds)
+    return seconds
+
+
+def warmup(messages=None):
+    """
+    Load the NLU model and parse a few messages, start the solver processes. Run once in
+    every worker after fork, before it handles requests.
+    """
+    from seabattle import dialog_manager as dm
+    from seabattle import solver
+
+    started = time.monotonic()
+    backend = dm.get_nlu_backend()
+    for message in messages or WARMUP_MESSAGES:
+        backend.parse(message)
+    solver.start_pool()
+
+    seconds = time.monotonic() - started
+    log.info('Warmed up in %.3fs', seconds)
+    return seconds
+
+
+def freeze():
+    """Keep objects loaded so far out of garbage collection, so that it doesn't touch their pages after fork."""
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check import time of the service against the budget')
+    parser.add_argument('--module', default='seabattle.api')
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET * 1000)
+    parser.add_argument('--top', type=int, default=15, help='slowest modules and packages to show')
+    parser.add_argument('--warmup', action='store_true', help='also measure loading models and the first turn')
+    args = parser.parse_args()
+
+    records = measure_imports(args.module)
+    total = max(r.cumulative for r in records if r.module == args.module)
+
+    print('Slowest modules, cumulative:')
+    for r in sorted(records, key=lambda r: r.cumulative, reverse=True)[:args.top]:
+        print('  %-50s %8.1f ms' % (r.module, r.cumulative * 1000))
+    print('Slowest packages, self:')
+    for package, seconds in report_by_package(records)[:args.top]:
+        print('  %-50s %8.1f ms' % (package, seconds * 1000))
+
+    if args.warmup:
+        logging.basicConfig(level=logging.WARNING)
+        print('Preload: %.1f ms' % (preload() * 1000))
+        print('Warmup: %.1f ms' % (warmup() * 1000))
+
+    print('import %s: %.1f ms, budget %.1f ms' % (args.module, total * 1000, args.budget_ms))
+    if total * 1000 > args.budget_ms:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
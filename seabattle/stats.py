@@ -0,0 +1,7 @@
+# coding: utf-8
+
+
+def percentile(values, q):
+    """Nearest-rank `q` quantile of `values`, 0 <= q <= 1."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
@@ -0,0 +1,225 @@
+# coding: utf-8
+
+import argparse
+import importlib
+import logging
+import os
+import random
+import threading
+import time
+
+from seabattle import game as gm
+from seabattle import stats
+
+
+log = logging.getLogger(__name__)
+
+# strategy of new games, the file below overrides it while the service is running
+DEFAULT_STRATEGY = os.environ.get('SEABATTLE_STRATEGY', 'lines')
+STRATEGY_FILE = os.environ.get('SEABATTLE_STRATEGY_FILE', 'config/strategy.txt')
+# modules registering strategies shipped with the skill, imported on first lookup
+BUILTIN_MODULES = ['seabattle.solver', 'seabattle.endgame']
+
+_registry = {}
+_builtins_loaded = False
+_config_lock = threading.Lock()
+_config = {'path': None, 'mtime': None, 'name': None}
+_game_classes = {}
+
+
+class Strategy(object):
+    """
+    How a game picks its shots. Every game gets its own instance, which is pickled into
+    the session together with the game, so a strategy may keep state between shots.
+
+    `reset` is called when a new game starts, `choose_shot` returns the index of the
+    enemy field cell to shoot at, `on_reply` gets 'hit', 'kill' or 'miss' after the
+    reply has been marked on `game.enemy_field`.
+    """
+
+    name = None
+
+    def reset(self, game):
+        pass
+
+    def choose_shot(self, game):
+        raise NotImplementedError()
+
+    def on_reply(self, game, message):
+        pass
+
+
+def register(cls):
+    """Class decorator adding a strategy to the registry under its `name`."""
+    if not cls.name:
+        raise ValueError('Strategy %s has no name' % cls.__name__)
+    _registry[cls.name] = cls
+    return cls
+
+
+def _load_builtins():
+    global _builtins_loaded
+    if not _builtins_loaded:
+        _builtins_loaded = True
+        for module in BUILTIN_MODULES:
+            importlib.import_module(module)
+
+
+def names():
+    _load_builtins()
+    return sorted(_registry)
+
+
+def get(name):
+    """
+    Strategy class by its registered name, or by 'module:Class' for strategies
+    which are not registered, the module is imported then.
+    """
+    if name not in _registry:
+        _load_builtins()
+    if name not in _registry and ':' in name:
+        module, cls_name = name.split(':', 1)
+        return getattr(importlib.import_module(module), cls_name)
+    try:
+        return _registry[name]
+    except KeyError:
+        raise ValueError('Unknown strategy %s' % name)
+
+
+def current_name(path=None):
+    """
+    Strategy for new games: the name in `path` if the file exists, DEFAULT_STRATEGY otherwise.
+    The file is read again when it changes, so strategies are swapped without a restart.
+    """
+    path = path or STRATEGY_FILE
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return DEFAULT_STRATEGY
+
+    with _config_lock:
+        if _config['mtime'] != mtime or _config['path'] != path:
+            with open(path, encoding='utf-8') as f:
+                name = f.read().strip()
+            try:
+                get(name)
+            except (ImportError, AttributeError, ValueError):
+                log.exception('Strategy %r from %s can\'t be loaded, using %s', name, path, DEFAULT_STRATEGY)
+                name = DEFAULT_STRATEGY
+            else:
+                log.info('Strategy of new games: %s', name)
+            _config.update(mtime=mtime, path=path, name=name)
+        return _config['name']
+
+
+def create(name=None):
+    return get(name or current_name())()
+
+
+@register
+class LinesStrategy(Strategy):
+    """
+    Search mode shoots at the middle of the longest empty run of a row or a column,
+    target mode walks along the damaged ship, see Game.try_detect_next_ship_cell.
+    """
+
+    name = 'lines'
+
+    def choose_shot(self, game):
+        if game.next_shot_index is None:
+            return game.get_random_field()
+        return game.next_shot_index
+
+    def find_target(self, game):
+        game.try_detect_next_ship_cell()
+
+    def on_reply(self, game, message):
+        if message == 'hit':
+            game.last_shot_damage = game.last_shot_position
+            self.find_target(game)
+        elif message == 'kill':
+            game.last_shot_damage = None
+        elif message == 'miss' and game.last_shot_damage is not None:
+            self.find_target(game)
+
+
+@register
+class RandomStrategy(Strategy):
+    """Any cell which may still hide a ship, a baseline for benchmarks."""
+
+    name = 'random'
+
+    def choose_shot(self, game):
+        return random.choice(game.get_line_index().empty)
+
+
+def game_class(name):
+    """Game class playing with strategy `name`, for simulations and benchmarks."""
+    if name not in _game_classes:
+        _game_classes[name] = type('Game_%s' % name, (gm.Game,), {'strategy_name': name})
+    return _game_classes[name]
+
+
+def benchmark(name, games=50, reference='lines', size=10, seed=0):
+    """
+    The standard benchmark of a strategy: win rate in mirrored games against `reference`,
+    shots needed to sink the default fleet and time to choose a shot.
+    """
+    from seabattle import bench
+    from seabattle import simulate
+
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        results = []
+        for _ in range(-(-games // 2)):
+            results.extend(simulate.play_mirrored_pair(game_class(name), game_class(reference), size))
+
+        shots = []
+        shot_times = []
+        started = time.perf_counter()
+        for _ in range(games):
+            _, times = bench.play_out(game_class(name), size, gm.BaseGame.default_ships)
+            shots.append(len(times))
+            shot_times.extend(times)
+        elapsed = time.perf_counter() - started
+    finally:
+        random.setstate(state)
+
+    return {
+        'strategy': name,
+        'reference': reference,
+        'games': len(results),
+        'win_rate': sum(results) / len(results),
+        'mean_shots': sum(shots) / len(shots),
+        'max_shots': max(shots),
+        'shot_mean_us': sum(shot_times) / len(shot_times) * 1e6,
+        'shot_p95_us': stats.percentile(shot_times, 0.95) * 1e6,
+        'shot_max_us': max(shot_times) * 1e6,
+        'seconds': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the standard benchmark for registered strategies')
+    parser.add_argument('strategies', nargs='*', help='registered names or module:Class, all registered by default')
+    parser.add_argument('--games', type=int, default=50)
+    parser.add_argument('--reference', default='lines')
+    parser.add_argument('--size', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # run with -m this module is __main__, plugins register in the imported one
+    from seabattle import strategies
+
+    print('%-14s %8s %8s %10s %12s %12s %12s' % (
+        'strategy', 'win', 'shots', 'max shots', 'shot us', 'p95 us', 'max us'))
+    for name in args.strategies or strategies.names():
+        r = strategies.benchmark(name, args.games, args.reference, args.size, args.seed)
+        print('%(strategy)-14s %(win_rate)8.2f %(mean_shots)8.1f %(max_shots)10d '
+              '%(shot_mean_us)12.1f %(shot_p95_us)12.1f %(shot_max_us)12.1f' % r)
+
+
+if __name__ == '__main__':
+    main()
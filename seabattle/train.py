@@ -0,0 +1,187 @@
+# coding: utf-8
+
+import argparse
+import functools
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+from seabattle import nlu
+
+
+log = logging.getLogger(__name__)
+
+CONFIG_PATH = 'config/nlu_config.yml'
+CACHE_FILE = 'train_cache.json'
+TIMINGS_FILE = 'train_timings.json'
+
+# components which only prepare messages for others and are needed by both models
+SHARED_COMPONENTS = {
+    'SpacyNLP', 'nlp_spacy', 'MitieNLP', 'nlp_mitie',
+    'SpacyTokenizer', 'tokenizer_spacy', 'WhitespaceTokenizer', 'tokenizer_whitespace',
+    'MitieTokenizer', 'tokenizer_mitie', 'JiebaTokenizer', 'tokenizer_jieba',
+}
+ENTITY_COMPONENTS = {
+    'CRFEntityExtractor', 'ner_crf', 'SpacyEntityExtractor', 'ner_spacy',
+    'MitieEntityExtractor', 'ner_mitie', 'DucklingHTTPExtractor', 'ner_duckling_http',
+    'EntitySynonymMapper', 'ner_synonyms',
+}
+
+
+def split_pipeline(pipeline):
+    """Split rasa pipeline into independently trainable intent and entity pipelines."""
+    intent = [c for c in pipeline if c['name'] not in ENTITY_COMPONENTS]
+    entity = [c for c in pipeline if c['name'] in SHARED_COMPONENTS or c['name'] in ENTITY_COMPONENTS]
+    return {'intent': intent, 'entity': entity}
+
+
+def data_views(examples):
+    """Only the parts of the dataset every model learns from, so unrelated edits don't retrain it."""
+    return {
+        'intent': [(e['text'], e['intent']) for e in examples],
+        'entity': [(e['text'], sorted((x['start'], x['end'], x['entity'], x['value']) for x in e['entities']))
+                   for e in examples],
+    }
+
+
+def content_hash(*values):
+    return hashlib.sha1(json.dumps(values, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _timed(name, method, timings):
+    """`method` appending (name, seconds) of every call to `timings`."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.time()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            timings.append((name, time.time() - started))
+    return wrapper
+
+
+def train_rasa_part(task):
+    """Train one rasa pipeline, persist it as `<model path>/default/<part>` and time every component."""
+    part, language, pipeline, data_path, model_path = task
+
+    from rasa_nlu import config as rasa_config
+    from rasa_nlu.model import Trainer
+    from rasa_nlu.training_data import load_data
+
+    started = time.time()
+    trainer = Trainer(rasa_config.RasaNLUModelConfig({'language': language, 'pipeline': pipeline}))
+    data = load_data(data_path, language)
+    data.validate()
+    timings = [('load', time.time() - started)]
+
+    for component in trainer.pipeline:
+        component.train = _timed(component.name, component.train, timings)
+    trainer.train(data)
+
+    started = time.time()
+    trainer.persist(model_path, project_name='default', fixed_model_name=part)
+    timings.append(('persist', time.time() - started))
+
+    return part, timings
+
+
+def train_ngram(data_path, model_path, force=False):
+    """Train and cache the ngram model, None if the cached one is up to date."""
+    if not force and nlu.NgramBackend.is_cached(model_path, data_path):
+        log.info('ngram model is up to date, skipping')
+        return None
+
+    started = time.time()
+    nlu.NgramBackend(nlu.load_examples(data_path)).save(model_path, nlu.dataset_hash(data_path))
+    return 'ngram', [('NgramBackend', time.time() - started)]
+
+
+def train(config_path=CONFIG_PATH, data_path=nlu.INTENTS_PATH, model_path=nlu.MODEL_PATH,
+          processes=None, force=False):
+    from rasa_nlu import config as rasa_config
+
+    cfg = rasa_config.load(config_path)
+    with open(data_path, encoding='utf-8') as f:
+        examples = json.load(f)['rasa_nlu_data']['common_examples']
+
+    pipelines = split_pipeline(cfg.pipeline)
+    views = data_views(examples)
+
+    cache_path = os.path.join(model_path, CACHE_FILE)
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    hashes = {}
+    tasks = []
+    cached = []
+    for part, pipeline in sorted(pipelines.items()):
+        hashes[part] = content_hash(cfg.language, pipeline, views[part])
+        model_dir = os.path.join(model_path, 'default', part)
+        if not force and cache.get(part) == hashes[part] and os.path.isdir(model_dir):
+            log.info('%s model is up to date, skipping', part)
+            cached.append(part)
+            continue
+        tasks.append((part, cfg.language, pipeline, data_path, model_path))
+
+    started = time.time()
+    results = []
+    ngram = train_ngram(data_path, os.path.join(model_path, nlu.NGRAM_MODEL_FILE), force)
+    if ngram is None:
+        cached.append('ngram')
+    else:
+        results.append(ngram)
+    if len(tasks) > 1 and processes != 1:
+        # spawn keeps tensorflow state out of the parent and between the workers
+        pool = multiprocessing.get_context('spawn').Pool(min(len(tasks), processes or len(tasks)))
+        try:
+            results.extend(pool.map(train_rasa_part, tasks))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results.extend(map(train_rasa_part, tasks))
+
+    for part, _ in results:
+        if part in hashes:
+            cache[part] = hashes[part]
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+
+    timings = {
+        'total': time.time() - started,
+        'trained': sorted(part for part, _ in results),
+        'cached': sorted(cached),
+        'components': {part: timings for part, timings in results},
+    }
+    with open(os.path.join(model_path, TIMINGS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(timings, f, indent=2)
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train NLU models, retraining only what has changed')
+    parser.add_argument('--config', default=CONFIG_PATH)
+    parser.add_argument('--data', default=nlu.INTENTS_PATH)
+    parser.add_argument('--path', default=nlu.MODEL_PATH)
+    parser.add_argument('--processes', type=int, help='parallel trainings, one per model by default')
+    parser.add_argument('--force', action='store_true', help='retrain even if nothing has changed')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+
+    timings = train(args.config, args.data, args.path, args.processes, args.force)
+    for part, components in sorted(timings['components'].items()):
+        for name, seconds in components:
+            print('%-8s %-28s %8.2fs' % (part, name, seconds))
+    print('Total: %.2fs' % timings['total'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# coding: utf-8
+from seabattle import analytics
+from seabattle import dialog_manager as dm
+from seabattle import game as gm
+from seabattle import session
+
+import json
+
+
+def _summary(result, shots=10, turns=12):
+    stats = analytics.new_game_stats()
+    stats.update(shots=shots, turns=turns)
+    return analytics.summarize(stats, result, 10, 'яндекс')
+
+
+def test_writer_appends_json_lines(tmpdir):
+    path = str(tmpdir.join('logs', 'games.jsonl'))
+    writer = analytics.Writer(path)
+    for result in ('victory', 'defeat', 'victory'):
+        writer.submit(_summary(result))
+    writer.join()
+
+    with open(path, encoding='utf-8') as f:
+        results = [json.loads(line)['result'] for line in f]
+    assert results == ['victory', 'defeat', 'victory']
+
+
+def test_aggregator_reads_only_new_games(tmpdir):
+    path = str(tmpdir.join('games.jsonl'))
+    state_path = str(tmpdir.join('state.json'))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(_summary('victory', shots=20)) + '\n')
+        f.write(json.dumps(_summary('defeat', shots=40)) + '\n')
+        # the writer hasn't finished this one yet
+        f.write(json.dumps(_summary('victory'))[:10])
+
+    aggregator = analytics.Aggregator.load(path, state_path)
+    assert aggregator.update() == 2
+    aggregator.save(state_path)
+    report = aggregator.report()
+    assert report['games'] == 2
+    assert report['win_rate'] == 0.5
+    assert report['mean_shots'] == 30
+
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(_summary('victory', shots=30))[10:] + '\n')
+
+    aggregator = analytics.Aggregator.load(path, state_path)
+    assert aggregator.update() == 1
+    assert aggregator.update() == 0
+    report = aggregator.report()
+    assert report['games'] == 3
+    assert report['mean_shots'] == 30
+    assert report['recent']['games'] == 3
+
+
+def test_recent_window(tmpdir):
+    aggregator = analytics.Aggregator(str(tmpdir.join('games.jsonl')), window=2)
+    for result in ('defeat', 'victory', 'victory'):
+        aggregator.add(_summary(result))
+
+    report = aggregator.report()
+    assert report['recent'] == {'games': 2, 'win_rate': 1.0, 'mean_shots': 10, 'mean_turns': 12}
+    assert abs(report['win_rate'] - 2 / 3) < 1e-9
+
+
+def test_finished_game_is_recorded(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(analytics, 'record', recorded.append)
+
+    session_obj = session.get('analytics-user')
+    dm.DialogManager(session_obj).handle_message('новая игра')
+    session_obj['game'].start_new_game(3, [gm.EMPTY] * 8 + [gm.SHIP], [1], numbers=True)
+
+    dm.DialogManager(session_obj).handle_message('начинай')
+    dm.DialogManager(session_obj).handle_message('мимо. я хожу 3 3')
+    dm.DialogManager(session_obj).handle_message('ура победа')
+
+    assert len(recorded) == 1
+    summary = recorded[0]
+    assert summary['result'] == 'defeat'
+    assert summary['turns'] == 3
+    assert summary['shots'] == 1
+    assert summary['enemy_shots'] == 1
+    assert summary['stages']['total'] >= summary['stages']['nlu'] > 0
+    assert session_obj['game'] is None
+    assert session_obj['stats'] is None
+
+
+def test_victory_by_our_shot_is_recorded(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(analytics, 'record', recorded.append)
+
+    session_obj = session.get('analytics-winner')
+    dm.DialogManager(session_obj).handle_message('новая игра')
+    session_obj['game'].start_new_game(3, [gm.EMPTY] * 8 + [gm.SHIP], [1], numbers=True)
+
+    dm.DialogManager(session_obj).handle_message('начинай')
+    response = dm.DialogManager(session_obj).handle_message('корабль утонул')
+
+    assert response.key == 'victory'
+    assert [summary['result'] for summary in recorded] == ['victory']
+    assert recorded[0]['shots'] == 1
+    assert session_obj['game'] is None
+    assert session_obj['stats'] is None
@@ -0,0 +1,116 @@
+# coding: utf-8
+from seabattle import api, dialog_manager as dm, metrics, session
+
+import json
+import threading
+from unittest import mock
+
+import pytest
+
+
+def test_parse_envelope_keeps_raw_values():
+    body = ' {"version": "1.0", "session" : {"user_id": "u1", "new": true},\n "request": {"command": "я хожу 1 2"}}'
+    envelope = api.parse_envelope(body)
+
+    assert envelope['version'] == ('1.0', '"1.0"')
+    assert envelope['session'] == ({'user_id': 'u1', 'new': True}, '{"user_id": "u1", "new": true}')
+    assert envelope['request'][0] == {'command': 'я хожу 1 2'}
+
+
+@pytest.mark.parametrize('body', ['[]', '{"version" "1.0"}', '{"version": "1.0" "session": {}}', '{"version": '])
+def test_parse_envelope_rejects_invalid_json(body):
+    with pytest.raises(ValueError):
+        api.parse_envelope(body)
+
+
+def test_render_response_is_valid_json():
+    envelope = api.parse_envelope('{"version": "1.0", "session": {"user_id": "юзер"}}')
+    rendered = api.render_response(envelope, {'text': 'Ты попала', 'end_session': False})
+
+    assert json.loads(rendered) == {
+        'version': '1.0',
+        'session': {'user_id': 'юзер'},
+        'response': {'text': 'Ты попала', 'end_session': False},
+    }
+
+
+def post(client, command, message_id, session_id='session1'):
+    body = {
+        'version': '1.0',
+        'session': {'session_id': session_id, 'message_id': message_id, 'user_id': 'api_user', 'new': False},
+        'request': {'command': command, 'original_utterance': command},
+    }
+    response = client.post('/', data=json.dumps(body), content_type='application/json')
+    return json.loads(response.get_data(as_text=True))['response']['text']
+
+
+def test_retried_request_is_handled_once():
+    client = api.app.test_client()
+    post(client, 'новая игра', 0)
+
+    with mock.patch.object(dm.DialogManager, 'handle_message', side_effect=dm.DialogManager.handle_message,
+                           autospec=True) as handle_message:
+        first = post(client, 'начинай', 1)
+        assert post(client, 'начинай', 1) == first
+        assert handle_message.call_count == 1
+
+        post(client, 'начинай', 1, session_id='session2')
+        assert handle_message.call_count == 2
+
+
+def test_overload_is_shed_with_repeat_response(monkeypatch):
+    metrics.reset()
+    client = api.app.test_client()
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(api, '_slots', slots)
+
+    assert post(client, 'начинай', 10) == dm.MESSAGE_TEMPLATES['dontunderstand']
+    assert metrics.snapshot()['counters']['shed_requests'] == 1
+
+
+def test_request_past_deadline_is_shed_and_not_cached(monkeypatch):
+    metrics.reset()
+    client = api.app.test_client()
+    post(client, 'новая игра', 20)
+
+    monkeypatch.setattr(api, 'DEADLINE', -1)
+    assert post(client, 'начинай', 21) == dm.MESSAGE_TEMPLATES['dontunderstand']
+    assert metrics.snapshot()['counters']['shed_requests'] == 1
+
+    monkeypatch.setattr(api, 'DEADLINE', 1.5)
+    assert post(client, 'начинай', 21) != dm.MESSAGE_TEMPLATES['dontunderstand']
+
+
+def test_request_waiting_for_session_past_deadline_is_shed(monkeypatch):
+    metrics.reset()
+    client = api.app.test_client()
+    post(client, 'новая игра', 30)
+
+    lock = session._lock_for('api_user')
+    lock.acquire()
+    threading.Timer(0.2, lock.release).start()
+    monkeypatch.setattr(api, 'DEADLINE', 0.1)
+    with mock.patch.object(dm.DialogManager, 'handle_message') as handle_message:
+        assert post(client, 'начинай', 31) == dm.MESSAGE_TEMPLATES['dontunderstand']
+        assert not handle_message.called
+    assert metrics.snapshot()['counters']['shed_requests'] == 1
+
+
+@pytest.mark.parametrize('body', ['not json', '{"version": "1.0"}', '{"session": {"user_id": "u1"}}'])
+def test_malformed_request_is_rejected(body):
+    client = api.app.test_client()
+    response = client.post('/', data=body, content_type='application/json')
+
+    assert response.status_code == 400
+
+
+def test_metrics_need_the_secret(monkeypatch):
+    client = api.app.test_client()
+    assert client.get('/metrics', headers={'X-Seabattle-Metrics': '1'}).status_code == 404
+
+    monkeypatch.setattr(api, 'METRICS_SECRET', 's3cret')
+    assert client.get('/metrics').status_code == 404
+    response = client.get('/metrics', headers={'X-Seabattle-Metrics': 's3cret'})
+    assert response.status_code == 200
+    assert 'counters' in json.loads(response.get_data(as_text=True))
@@ -0,0 +1,41 @@
+# coding: utf-8
+from seabattle import bot
+
+import threading
+import time
+
+
+def test_chat_messages_are_handled_in_order():
+    handled = []
+    lock = threading.Lock()
+
+    def handler(update):
+        time.sleep(0.001)
+        with lock:
+            handled.append((update.message.chat_id, update.message.text))
+
+    workers = bot.ChatWorkers(handler, workers=4)
+    for i in range(20):
+        for chat_id in range(5):
+            workers.submit(bot.FakeUpdate(bot.FakeMessage(chat_id, i)))
+    workers.join()
+
+    for chat_id in range(5):
+        assert [text for c, text in handled if c == chat_id] == list(range(20))
+
+
+def test_sender_keeps_chat_order():
+    telegram_bot = bot.FakeTelegramBot()
+    sender = bot.Sender(telegram_bot, max_size=4, threads=2)
+    for i in range(50):
+        sender.send('a', str(i))
+        sender.send('b', str(i))
+    sender.join()
+
+    assert [text for _, text in telegram_bot.sent['a']] == [str(i) for i in range(50)]
+    assert [text for _, text in telegram_bot.sent['b']] == [str(i) for i in range(50)]
+
+
+def test_load_test_answers_every_message():
+    result = bot.load_test(chats=5, workers=2, senders=2, latency=0)
+    assert result['messages'] == 5 * len(bot.LOAD_TEST_SCRIPT)
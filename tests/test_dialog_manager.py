@@ -1,11 +1,9 @@
 # coding: utf-8
 
-from __future__ import unicode_literals
-
 from seabattle import dialog_manager as dm, game as gm
 from seabattle import session
 
-import mock
+from unittest import mock
 
 
 user_id = 'user1'
@@ -74,3 +72,58 @@ def test_game_1():
     assert say('корабль утонул') == shot(shots[4])
     assert say('мимо. я хожу 1 2') == kill()
     assert say('ура победа') == defeat()
+
+
+def test_switch_between_opponents():
+    switch_session = session.get('switch-user')
+
+    def say_switch(message):
+        return dm.DialogManager(switch_session).handle_message(message)
+
+    say_switch('новая игра с яндексом')
+    yandex_game = switch_session['game']
+    yandex_shot = say_switch('начинай').text
+
+    assert say_switch('новая игра с алисой').text == newgame('алиса')
+    assert switch_session['game'] is not yandex_game
+    assert switch_session['games'].opponents() == ['яндекс']
+
+    response = say_switch('вернемся к игре с яндексом')
+    assert response.text == dm.MESSAGE_TEMPLATES['resumegame'] % {'opponent': 'яндекс'}
+    assert switch_session['opponent'] == 'яндекс'
+    assert switch_session['game'].field == yandex_game.field
+    assert switch_session['games'].opponents() == ['алиса']
+
+    # "repeat" still repeats the last move of the resumed game
+    assert say_switch('не поняла').text == yandex_shot
+
+    response = say_switch('продолжим игру с марусей')
+    assert response.key == 'nogame'
+    assert switch_session['opponent'] == 'яндекс'
+
+
+def test_nlu_timeout_falls_back_to_ngram(monkeypatch):
+    class TimingOutBackend(object):
+        name = 'rasa'
+
+        def parse(self, message, deadline=None):
+            raise dm.nlu.NLUTimeout()
+
+    monkeypatch.setattr(dm, 'nlu_backend', TimingOutBackend())
+    timeout_session = session.get('timeout-user')
+    response = dm.DialogManager(timeout_session).handle_message('новая игра с яндексом')
+
+    assert response.text == newgame('яндекс')
+
+
+def test_victory_by_our_shot_ends_session():
+    won_session = session.get('won-user')
+    dm.DialogManager(won_session).handle_message('новая игра')
+    won_session['game'].start_new_game(3, [gm.EMPTY] * 8 + [gm.SHIP], [1], numbers=True)
+    dm.DialogManager(won_session).handle_message('начинай')
+
+    response = dm.DialogManager(won_session).handle_message('корабль утонул')
+    assert response == dm.DMResponse('victory', dm.MESSAGE_TEMPLATES['victory'], None, True)
+    assert won_session['game'] is None
+
+    assert dm.DialogManager(won_session).handle_message('не поняла') == response
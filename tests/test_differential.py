@@ -0,0 +1,54 @@
+# coding: utf-8
+from seabattle import differential
+from seabattle import game as gm
+
+import pytest
+
+
+class DeadOnFirstHitGame(gm.Game):
+    def is_dead_ship(self, last_index):
+        return True
+
+
+class NoDiagonalSkipGame(gm.Game):
+    def nearest_generator(self, pos):
+        for n_x, n_y in ((pos[0] - 1, pos[1]), (pos[0] + 1, pos[1]), (pos[0], pos[1] - 1), (pos[0], pos[1] + 1)):
+            if not self.is_point_invalid((n_x, n_y)):
+                yield n_x, n_y
+
+
+def test_generate_case_is_deterministic():
+    assert differential.generate_case(1) == differential.generate_case(1)
+    assert differential.generate_case(1) != differential.generate_case(2)
+
+
+def test_reference_is_equivalent_to_itself():
+    differential.assert_equivalent(gm.Game, cases=5)
+
+
+@pytest.mark.parametrize('engine_cls', [DeadOnFirstHitGame, NoDiagonalSkipGame])
+def test_broken_engine_is_caught(engine_cls):
+    failure = differential.check(engine_cls, cases=20)
+
+    assert failure is not None
+    assert failure.expected != failure.actual
+    assert differential.compare(failure.case, gm.Game, engine_cls) is not None
+    assert len(failure.case.actions) <= 10
+
+
+def test_shrink_finds_minimal_actions():
+    case = differential.generate_case(0)
+    bad = case.actions[17]
+
+    shrunk = differential.shrink(case, lambda c: bad in c.actions)
+
+    assert shrunk.actions == (bad,)
+
+
+def test_format_failure_names_differences():
+    failure = differential.check(DeadOnFirstHitGame, cases=20)
+
+    text = differential.format_failure(failure)
+
+    assert 'Engines diverge' in text
+    assert 'expected' in text
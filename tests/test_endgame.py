@@ -0,0 +1,137 @@
+# coding: utf-8
+from seabattle import endgame
+from seabattle import game as gm
+from seabattle import metrics
+from seabattle import solver
+from seabattle import strategies
+
+import random
+import time
+
+
+def _mask(cells):
+    return sum(1 << c for c in cells)
+
+
+def test_layouts_of_one_ship():
+    assert len(endgame.enumerate_layouts([gm.EMPTY] * 9, 3, 0, [2], 100)) == 12
+    # the hit in the middle is covered in one of four ways
+    assert len(endgame.enumerate_layouts([gm.EMPTY] * 9, 3, _mask([4]), [2], 100)) == 4
+
+
+def test_layouts_dont_touch_and_cover_hits():
+    field = [gm.EMPTY] * 16
+    layouts = endgame.enumerate_layouts(field, 4, _mask([0]), [2, 1], 1000)
+
+    assert layouts
+    for ships in layouts:
+        assert any(ship & 1 for ship in ships)
+        a, b = (set(endgame._bits(ship)) for ship in ships)
+        assert not any(abs(x % 4 - y % 4) <= 1 and abs(x // 4 - y // 4) <= 1 for x in a for y in b)
+
+
+def test_too_many_layouts():
+    assert endgame.enumerate_layouts([gm.EMPTY] * 100, 10, 0, [1, 1], 30) is None
+
+
+def test_expected_shots_for_one_cell_ship():
+    field = [gm.MISS] * 9
+    field[0] = field[1] = field[2] = gm.EMPTY
+    layouts = endgame.enumerate_layouts(field, 3, 0, [1], 100)
+
+    # found with the first, the second or the third shot
+    assert endgame.ExactSolver(layouts, 0).solve()[0] == 2.0
+
+
+def test_damaged_ship_is_finished_in_expected_time():
+    layouts = endgame.enumerate_layouts([gm.EMPTY] * 9, 3, _mask([4]), [2], 100)
+    expected, cell = endgame.ExactSolver(layouts, _mask([4])).solve()
+
+    # neighbours are tried one by one: 1 + 3/4 * (1 + 2/3 * (1 + 1/2))
+    assert expected == 2.5
+    assert cell in (1, 3, 5, 7)
+
+
+def _brute_force(layouts, shot=0):
+    # all orders of shots, replies tell which layouts are left
+    left = [ships for ships in layouts if any(ship & ~shot for ship in ships)]
+    if not left:
+        return 0.0
+    cells = set()
+    for ships in left:
+        cells.update(endgame._bits(sum(ships) & ~shot))
+    best = float('inf')
+    for cell in cells:
+        groups = {}
+        for ships in left:
+            reply = endgame._shoot(tuple(sorted(ship & ~shot for ship in ships if ship & ~shot)), cell)[0]
+            groups.setdefault(reply, []).append(ships)
+        value = 1 + sum(len(g) / len(left) * _brute_force(g, shot | 1 << cell) for g in groups.values())
+        best = min(best, value)
+    return best
+
+
+def test_matches_brute_force():
+    random.seed(2)
+    checked = 0
+    for _ in range(20):
+        field = [random.choice([gm.EMPTY, gm.MISS]) for _ in range(16)]
+        layouts = endgame.enumerate_layouts(field, 4, 0, [2, 1], 8)
+        if not layouts:
+            continue
+        assert abs(endgame.ExactSolver(layouts, 0).solve()[0] - _brute_force(layouts)) < 1e-9
+        checked += 1
+    assert checked >= 3
+
+
+def test_search_stops_at_deadline():
+    layouts = endgame.enumerate_layouts([gm.EMPTY] * 36, 6, 0, [2, 1], 10000)
+    solver = endgame.ExactSolver(layouts, 0, time.monotonic() + 0.01)
+
+    started = time.monotonic()
+    try:
+        solver.solve()
+    except endgame.Timeout:
+        pass
+    assert time.monotonic() - started < 0.1
+    assert solver.most_likely_cell() is not None
+
+
+def test_plays_full_game():
+    random.seed(4)
+    target = gm.Game()
+    target.start_new_game(10)
+    shooter = strategies.game_class('endgame')()
+    shooter.start_new_game(10, [gm.EMPTY] * 100, numbers=True)
+    shooter.strategy.budget = shooter.strategy.endgame_budget = 0.005
+
+    shots = 0
+    while not target.is_defeat():
+        position = shooter.convert_to_position(shooter.do_shot().replace(',', ''))
+        shooter.handle_enemy_reply(target.handle_enemy_shot(position))
+        shots += 1
+
+    assert shooter.is_victory()
+    assert shots <= 100
+
+
+def test_exact_shot_replaces_sampling(monkeypatch):
+    shooter = strategies.game_class('endgame')()
+    shooter.start_new_game(3, [gm.EMPTY] * 9, [2], numbers=True)
+    monkeypatch.setattr(solver, 'sample_counts', None)  # must not be called
+
+    shooter.last_shot_position = (2, 2)
+    shooter.handle_enemy_reply('hit')
+    assert shooter.next_shot_index in (1, 3, 5, 7)
+
+
+def test_shot_without_time_left_is_counted():
+    metrics.reset()
+    shooter = strategies.game_class('endgame')()
+    shooter.start_new_game(3, [gm.EMPTY] * 9, [2], numbers=True)
+    shooter.deadline = time.monotonic()
+
+    shooter.last_shot_position = (2, 2)
+    shooter.handle_enemy_reply('hit')
+    assert shooter.next_shot_index in (1, 3, 5, 7)
+    assert metrics.snapshot()['counters']['degraded_shot'] == 1
@@ -1,6 +1,9 @@
 # coding: utf-8
-from __future__ import unicode_literals
-from seabattle.game import Game
+from seabattle.game import EMPTY, MISS, SHIP, SKIP, Game, parse_number_words
+
+import random
+import time
+from itertools import chain
 
 import pytest
 
@@ -131,6 +134,14 @@ def test_handle_reply(game):
     game.handle_enemy_reply('miss')
 
 
+def test_shot_without_time_left_is_still_searched(game):
+    game.deadline = time.monotonic()
+
+    index = game.get_random_field()
+    assert game.enemy_field[index] == 0
+    assert game.calc_position(index) in [run[3] for run in game.get_line_index().longest_runs()]
+
+
 def test_disable_for_shot_all_near(game, enemy_field):
     for last_shot in [
         (5, 5),
@@ -269,3 +280,71 @@ def test_detect_next_shot(game, enemy_field, last_shot, next_shot):
     game.enemy_field = enemy_field
     game.try_detect_next_ship_cell()
     assert game.calc_position(game.next_shot_index) == next_shot
+
+
+@pytest.mark.parametrize('position, expected', [
+    ('двадцать один тридцать пять', (21, 35)),
+    ('сто двадцать', (100, 20)),
+    ('пятнадцать сорок два', (15, 42)),
+    ('сорок два пятнадцать', (42, 15)),
+    ('двадцать один два', (21, 2)),
+])
+def test_number_words_position(game, position, expected):
+    assert game.convert_to_position(position) == expected
+
+
+def test_invalid_number_words():
+    with pytest.raises(ValueError):
+        parse_number_words(['двадцать', 'одиннадцать'])
+    with pytest.raises(ValueError):
+        parse_number_words(['один', 'двадцать'])
+
+
+def test_letters_fall_back_to_numbers_on_big_board():
+    g = Game()
+    g.start_new_game(20, [EMPTY] * 400, ships=[2])
+
+    assert g.convert_from_position((5, 15)) == 'д, 15'
+    assert g.convert_from_position((15, 5)) == '15, 5'
+
+
+@pytest.mark.parametrize('size', [10, 13, 30])
+def test_line_index_matches_full_scan(size):
+    random.seed(size)
+    g = Game()
+    g.start_new_game(size, [EMPTY] * size ** 2, ships=[1])
+
+    for _ in range(size ** 2 // 2):
+        g.enemy_field[random.randrange(size ** 2)] = random.choice([EMPTY, MISS, SHIP, SKIP])
+        index = g.get_line_index()
+
+        points = list(chain(g.generate_horizontal_lines_points(), g.generate_vertical_lines_points()))
+        max_length = max([length for _, length in points] or [0])
+        assert index.longest_lines_points() == [p for p in points if p[1] == max_length]
+        assert index.max_length == max_length
+        assert index.empty == [i for i, v in enumerate(g.enemy_field) if v == EMPTY]
+
+
+def test_big_board_game_finishes():
+    random.seed(0)
+    target = Game()
+    target.start_new_game(30, ships=[4, 3, 3, 2, 2, 2, 1, 1, 1, 1] * 9)
+    shooter = Game()
+    shooter.start_new_game(30, [EMPTY] * 900, target.ships, numbers=True)
+
+    shots = 0
+    while not target.is_defeat():
+        position = shooter.convert_to_position(shooter.do_shot().replace(',', ''))
+        shooter.handle_enemy_reply(target.handle_enemy_shot(position))
+        shots += 1
+
+    assert shooter.is_victory()
+    assert shots <= 900
+
+
+def test_impossible_fleet_raises():
+    g = Game()
+    g.field_attempts = 2
+    g.place_attempts = 10
+    with pytest.raises(ValueError):
+        g.start_new_game(3, ships=[3, 3, 3])
@@ -0,0 +1,91 @@
+# coding: utf-8
+from seabattle.idempotency import Overloaded, RequestCoalescer
+
+import threading
+import time
+
+import pytest
+
+
+def test_completed_request_is_served_from_cache():
+    coalescer = RequestCoalescer()
+    calls = []
+
+    def handler():
+        calls.append(1)
+        return len(calls)
+
+    assert coalescer.run(('s1', 1), handler) == 1
+    assert coalescer.run(('s1', 1), handler) == 1
+    assert coalescer.run(('s1', 2), handler) == 2
+    assert len(calls) == 2
+
+
+def test_in_flight_duplicates_wait_for_first_result():
+    coalescer = RequestCoalescer()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def handler():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return 'reply'
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(coalescer.run('key', handler)))
+    first.start()
+    started.wait()
+    duplicates = [threading.Thread(target=lambda: results.append(coalescer.run('key', handler))) for _ in range(3)]
+    for t in duplicates:
+        t.start()
+    release.set()
+    for t in [first] + duplicates:
+        t.join()
+
+    assert results == ['reply'] * 4
+    assert len(calls) == 1
+
+
+def test_cache_is_bounded():
+    coalescer = RequestCoalescer(max_size=2)
+    for i in range(3):
+        coalescer.run(i, lambda: i)
+    assert coalescer.run(0, lambda: 'again') == 'again'
+    assert coalescer.run(2, lambda: 'again') == 2
+
+
+def test_failures_are_not_cached():
+    coalescer = RequestCoalescer()
+
+    def fail():
+        raise RuntimeError()
+
+    with pytest.raises(RuntimeError):
+        coalescer.run('key', fail)
+    assert coalescer.run('key', lambda: 'ok') == 'ok'
+
+
+def test_duplicate_gives_up_at_deadline():
+    coalescer = RequestCoalescer()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait()
+        return 'late'
+
+    first = threading.Thread(target=lambda: coalescer.run('key', slow))
+    first.start()
+    started.wait()
+    try:
+        waited = time.monotonic()
+        with pytest.raises(Overloaded):
+            coalescer.run('key', slow, deadline=time.monotonic() + 0.05)
+        assert time.monotonic() - waited < 1
+    finally:
+        release.set()
+        first.join()
+    assert coalescer.run('key', slow) == 'late'
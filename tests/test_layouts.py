@@ -0,0 +1,40 @@
+# coding: utf-8
+from seabattle import game as gm, layouts, simulate
+
+
+def test_generate_keeps_hardest(tmpdir):
+    best = layouts.generate(6, 2, ['seabattle.game'], games=1, processes=1, size=5, ships=[2, 1], seed=1)
+    assert len(best) == 2
+    assert best[0][0] >= best[1][0]
+
+    path = str(tmpdir.join('layouts.json'))
+    layouts.save(path, best, ['seabattle.game'], size=5, ships=[2, 1])
+
+    pool = gm.load_layouts(path)
+    assert pool['layouts'] == [field for _, field in best]
+
+
+def test_game_draws_field_from_pool(tmpdir, monkeypatch):
+    field = [1, 0, 0,
+             0, 0, 0,
+             0, 0, 1]
+    path = str(tmpdir.join('layouts.json'))
+    layouts.save(path, [(5.0, field)], ['seabattle.game'], size=3, ships=[1, 1])
+    monkeypatch.setattr(gm, 'LAYOUTS_PATH', path)
+
+    game = gm.Game()
+    game.start_new_game(3, ships=[1, 1])
+    assert game.field == field
+    assert game.field is not gm.load_layouts(path)['layouts'][0]
+
+
+def test_simulator_fields_ignore_pool_unless_asked(tmpdir, monkeypatch):
+    field = [1, 0, 0,
+             0, 0, 0,
+             0, 0, 1]
+    path = str(tmpdir.join('layouts.json'))
+    layouts.save(path, [(5.0, field)], ['seabattle.game'], size=3, ships=[1, 1])
+    monkeypatch.setattr(gm, 'LAYOUTS_PATH', path)
+
+    assert any(simulate.generate_field(3, [1, 1]) != field for _ in range(20))
+    assert simulate.generate_field(3, [1, 1], layouts=path) == field
@@ -0,0 +1,168 @@
+# coding: utf-8
+from seabattle import nlu
+
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def backend():
+    return nlu.NgramBackend(nlu.load_examples())
+
+
+@pytest.mark.parametrize('message, intent', [
+    ('новая игра', 'newgame'),
+    ('начинай', 'letsstart'),
+    ('мимо я хожу 5 6', 'miss'),
+    ('ты попала', 'hit'),
+    ('корабль утонул', 'kill'),
+    ('не поняла повтори', 'dontunderstand'),
+    ('ура победа', 'victory'),
+    ('я проиграла', 'defeat'),
+    ('вернемся к игре с алисой', 'resumegame'),
+])
+def test_intents(backend, message, intent):
+    parsed = backend.parse(message)
+    assert parsed['intent']['name'] == intent
+    assert parsed['intent']['confidence'] >= 0.8
+
+
+def test_unknown_message_has_low_confidence(backend):
+    assert backend.parse('какая сегодня погода')['intent']['confidence'] < 0.8
+
+
+@pytest.mark.parametrize('message, value', [
+    ('я хожу 10 5', '10 5'),
+    ('мимо. я хожу в 7 9', '7 9'),
+    ('я хожу семь четыре', 'семь четыре'),
+    ('мимо я хожу двадцать один тридцать пять', 'двадцать один тридцать пять'),
+    ('мимо б 5 я', 'б 5'),
+    ('мимо я хожу к 2 с', 'к 2'),
+])
+def test_hit_entity(backend, message, value):
+    entities = backend.parse(message)['entities']
+    assert [(e['entity'], e['value']) for e in entities] == [('hit_entity', value)]
+
+
+def test_opponent_entity(backend):
+    entities = backend.parse('новая игра c яндексом')['entities']
+    assert [(e['entity'], e['value']) for e in entities] == [('opponent_entity', 'яндекс')]
+
+
+def test_resume_opponent_entity(backend):
+    entities = backend.parse('продолжим игру с яндексом')['entities']
+    assert [(e['entity'], e['value']) for e in entities] == [('opponent_entity', 'яндекс')]
+
+
+def test_cached_model(tmpdir, backend):
+    path = str(tmpdir.join('ngram_model.bin'))
+    nlu.NgramBackend.load(path)
+    cached = nlu.NgramBackend.load(path)
+
+    assert isinstance(cached.weights, nlu.MappedWeights)
+    assert len(cached.weights) == len(backend.weights)
+    assert cached.intents == backend.intents
+    for message in ('ты ранила', 'мимо я хожу 5 6', 'новая игра c яндексом', 'какая сегодня погода'):
+        assert cached.parse(message) == backend.parse(message)
+
+
+def test_mapped_weights_rows(tmpdir, backend):
+    path = str(tmpdir.join('ngram_model.bin'))
+    backend.save(path, 'hash')
+    weights = nlu.MappedWeights(path)
+
+    assert weights.meta['data_hash'] == 'hash'
+    for feature, row in list(backend.weights.items())[:100]:
+        assert weights.get(feature) == row
+    assert weights.get('no such feature') is None
+
+
+def test_model_is_retrained_when_data_changes(tmpdir):
+    path = str(tmpdir.join('ngram_model.bin'))
+    nlu.NgramBackend(nlu.load_examples()).save(path, 'old hash')
+
+    backend = nlu.NgramBackend.load(path)
+    assert nlu.MappedWeights(path).meta['data_hash'] != 'old hash'
+    assert backend.parse('ура победа')['intent']['name'] == 'victory'
+
+
+def test_batching_backend_groups_concurrent_messages(backend):
+    batch_sizes = []
+
+    class RecordingBackend(nlu.NLUBackend):
+        name = 'recording'
+
+        def parse_batch(self, messages):
+            batch_sizes.append(len(messages))
+            return backend.parse_batch(messages)
+
+    batching = nlu.BatchingBackend(RecordingBackend(), max_batch=4, max_wait=0.05)
+    messages = ['ты попала', 'я хожу 1 2', 'ура победа', 'начинай', 'убил', 'я проиграл']
+    results = {}
+
+    def _parse(message):
+        results[message] = batching.parse(message)
+
+    threads = [threading.Thread(target=_parse, args=(m,)) for m in messages]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sum(batch_sizes) == len(messages)
+    assert max(batch_sizes) <= 4
+    assert len(batch_sizes) < len(messages)
+    for message in messages:
+        assert results[message] == backend.parse(message)
+
+
+def test_batching_backend_propagates_errors():
+    class FailingBackend(nlu.NLUBackend):
+        def parse(self, message):
+            raise ValueError(message)
+
+    with pytest.raises(ValueError):
+        nlu.BatchingBackend(FailingBackend(), max_batch=2, max_wait=0.001).parse('ранил')
+
+
+def test_batching_backend_restarts_worker_after_fork(backend):
+    batching = nlu.BatchingBackend(backend, max_batch=2, max_wait=0.001)
+    assert batching.parse('ура победа')['intent']['name'] == 'victory'
+
+    # what a forked child sees: the worker thread belongs to another process
+    batching._worker_pid = -1
+    assert batching.parse('ура победа')['intent']['name'] == 'victory'
+
+
+def test_batching_backend_gives_up_at_deadline(backend):
+    release = threading.Event()
+
+    class StuckBackend(nlu.NLUBackend):
+        name = 'stuck'
+
+        def parse_batch(self, messages):
+            release.wait()
+            return backend.parse_batch(messages)
+
+    batching = nlu.BatchingBackend(StuckBackend(), max_batch=2, max_wait=0.001)
+    try:
+        with pytest.raises(nlu.NLUTimeout):
+            batching.parse('ура победа', deadline=time.monotonic() + 0.05)
+    finally:
+        release.set()
+
+
+def test_batching_is_off_without_batch_parse(monkeypatch, backend):
+    class PlainBackend(nlu.NLUBackend):
+        name = 'plain'
+
+        def parse(self, message, deadline=None):
+            return backend.parse(message)
+
+    monkeypatch.setitem(nlu.BACKENDS, 'plain', PlainBackend)
+    monkeypatch.setitem(nlu.BACKENDS, 'ngram', lambda: backend)
+
+    assert isinstance(nlu.load_backend('plain', batch_size=4), PlainBackend)
+    assert isinstance(nlu.load_backend('ngram', batch_size=4), nlu.BatchingBackend)
@@ -0,0 +1,44 @@
+# coding: utf-8
+from seabattle import nlu
+from seabattle import nlu_bench
+
+import collections
+
+
+def test_folds_cover_dataset_once():
+    examples = nlu.load_examples()
+    folds = nlu_bench.kfold(examples, 4)
+
+    tested = [e['text'] for _, test in folds for e in test]
+    assert sorted(tested) == sorted(e['text'] for e in examples)
+    for train_examples, test in folds:
+        assert len(train_examples) + len(test) == len(examples)
+        assert not {e['text'] for e in test} & {e['text'] for e in train_examples}
+
+
+def test_folds_are_stratified():
+    examples = [{'text': '%s %d' % (intent, i), 'intent': intent, 'entities': []}
+                for intent in ('hit', 'miss') for i in range(4)]
+    for _, test in nlu_bench.kfold(examples, 4):
+        assert collections.Counter(e['intent'] for e in test) == {'hit': 1, 'miss': 1}
+
+
+def test_evaluate_ngram():
+    result = nlu_bench.evaluate('ngram', nlu.load_examples(), folds=3)
+
+    assert result['intent_accuracy'] > 0.8
+    assert set(result['entities']) == {'hit_entity', 'opponent_entity'}
+    assert result['entities']['hit_entity']['f1'] > 0.8
+    assert result['entities']['opponent_entity']['support'] == 15
+    assert result['warm']['p50_ms'] <= result['warm']['p95_ms']
+    assert result['cold_first_parse_ms'] > 0
+    for error in result['errors']:
+        assert error['intent'] != error['predicted'] or error['entities'] != error['predicted_entities']
+
+
+def test_serving_ngram():
+    result = nlu_bench.serving('ngram', nlu.load_examples())
+
+    assert result['train_accuracy'] > 0.9
+    assert result['load_ms'] > 0
+    assert result['latency']['p50_ms'] <= result['latency']['p95_ms']
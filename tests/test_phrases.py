@@ -0,0 +1,32 @@
+# coding: utf-8
+from seabattle import dialog_manager as dm
+from seabattle import phrases
+
+
+def test_table_has_every_cell_key_and_mode():
+    table = dm.get_phrase_table(10)
+
+    assert len(table.positions) == 10 * 10 * len(dm.SHOT_TEMPLATE_KEYS) * 2
+    assert table.positions[(2, 3), 'miss', True] == ('2, 3', 'Мимо. Я хожу 2, 3', 'Мимо - Я хожу - 2 - - - - 3')
+    assert table.positions[(2, 3), 'shot', False][0] == 'б, 3'
+
+
+def test_lookup_matches_rendering():
+    table = dm.get_phrase_table(10)
+    for key in dm.SHOT_TEMPLATE_KEYS:
+        for shot in ('1, 1', '10, 7', 'к, 7'):
+            assert table.shot_reply(key, shot) == table.render(key, shot)
+    # not a cell of the board, still rendered
+    assert table.shot_reply('shot', '11, 11') == ('Я хожу 11, 11', 'Я хожу - 11 - - - - 11')
+
+
+def test_number_phrases_round_trip():
+    for size in (10, 30):
+        failures = dm.get_phrase_table(size).validate()
+        assert not [f for f in failures if f[2]]
+
+
+def test_opponent_prefix():
+    assert phrases.with_opponent('Яндекс', 'Я хожу 1, 1', 'Я хожу - 1 - - - - 1') == (
+        'Яндекс, Я хожу 1, 1', 'Яндекс - - Я хожу - 1 - - - - 1')
+    assert phrases.with_opponent('Алиса', 'алиса, привет') == ('алиса, привет', None)
@@ -0,0 +1,67 @@
+# coding: utf-8
+from seabattle import profiling
+
+import os
+import time
+
+
+def _busy(seconds):
+    until = time.time() + seconds
+    while time.time() < until:
+        pass
+
+
+def test_profiler_writes_collapsed_stacks(tmpdir):
+    with profiling.Profiler('test', path=str(tmpdir), interval=0.001) as profiler:
+        _busy(0.05)
+
+    assert os.path.dirname(profiler.filename) == str(tmpdir)
+    with open(profiler.filename, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        assert int(count) > 0
+    assert any('_busy' in line for line in lines)
+
+
+def test_nested_profiler_is_noop(tmpdir):
+    with profiling.Profiler('outer', path=str(tmpdir), interval=0.001):
+        with profiling.Profiler('inner', path=str(tmpdir), interval=0.001) as inner:
+            _busy(0.01)
+
+    assert inner.filename is None
+    assert len(tmpdir.listdir()) == 1
+
+
+def test_disabled_profiler_writes_nothing(tmpdir):
+    with profiling.Profiler('off', enabled=False, path=str(tmpdir)) as profiler:
+        _busy(0.01)
+
+    assert profiler.filename is None
+    assert not tmpdir.listdir()
+
+
+def test_profiled_samples_by_rate(tmpdir, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_RATE', 1.0)
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmpdir))
+
+    @profiling.profiled('func')
+    def func():
+        return 42
+
+    assert func() == 42
+    assert len(tmpdir.listdir()) == 1
+
+    monkeypatch.setattr(profiling, 'PROFILE_RATE', 0)
+    assert func() == 42
+    assert len(tmpdir.listdir()) == 1
+
+
+def test_profile_header_needs_the_secret(monkeypatch):
+    assert not profiling.header_allows('1')
+
+    monkeypatch.setattr(profiling, 'PROFILE_SECRET', 'секрет')
+    assert profiling.header_allows('секрет')
+    assert not profiling.header_allows('1')
+    assert not profiling.header_allows(None)
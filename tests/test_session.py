@@ -0,0 +1,104 @@
+# coding: utf-8
+from seabattle import game as gm
+from seabattle import metrics
+from seabattle import session
+
+import pickle
+import threading
+import time
+
+
+def _game():
+    g = gm.Game()
+    g.start_new_game(numbers=True)
+    return g
+
+
+def test_registry_keeps_compressed_snapshots():
+    registry = session.GameRegistry()
+    g = _game()
+    g.enemy_field[5] = gm.MISS
+    g.do_shot()
+    registry.park('яндекс', {'game': g, 'last': None, 'stats': None})
+
+    assert 'яндекс' in registry
+    assert registry.size() < len(pickle.dumps(g))
+
+    restored = registry.take('яндекс')['game']
+    assert 'яндекс' not in registry
+    assert restored.field == g.field
+    assert restored.enemy_field == g.enemy_field
+    assert restored.last_shot_position == g.last_shot_position
+
+
+def test_registry_drops_oldest_games():
+    registry = session.GameRegistry(max_games=2)
+    for opponent in ('a', 'b', 'c'):
+        registry.park(opponent, {'game': None})
+
+    assert registry.opponents() == ['b', 'c']
+
+
+def test_switch_games():
+    session_obj = session.get('session-switch-user')
+    first, second = _game(), _game()
+    session_obj.update(game=first, opponent='яндекс', last='last 1')
+
+    session.park_game(session_obj)
+    assert session_obj['game'] is None
+    session_obj.update(game=second, opponent='алиса', last='last 2')
+
+    assert session.resume_game(session_obj, 'яндекс')
+    assert session_obj['opponent'] == 'яндекс'
+    assert session_obj['last'] == 'last 1'
+    assert session_obj['game'].field == first.field
+    assert session_obj['games'].opponents() == ['алиса']
+
+    assert not session.resume_game(session_obj, 'маруся')
+    assert session_obj['opponent'] == 'яндекс'
+
+
+def test_resume_active_game_is_noop():
+    session_obj = session.get('session-noop-user')
+    g = _game()
+    session_obj.update(game=g, opponent='яндекс')
+
+    assert session.resume_game(session_obj, 'яндекс')
+    assert session_obj['game'] is g
+
+
+def test_requests_of_one_user_are_serialized():
+    def _turn():
+        with session.locked('locked-user') as session_obj:
+            count = session_obj.get('count', 0)
+            time.sleep(0.001)
+            session_obj['count'] = count + 1
+
+    threads = [threading.Thread(target=_turn) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert session.get('locked-user')['count'] == 20
+    assert metrics.snapshot()['timings']['session_lock_wait']['count'] >= 20
+
+
+def test_different_users_proceed_in_parallel():
+    users = ['parallel-user-%d' % i for i in range(10)]
+    first = users[0]
+    second = next(u for u in users if session._lock_for(u) is not session._lock_for(first))
+    inside = threading.Barrier(2, timeout=1)
+
+    def _turn(user_id):
+        with session.locked(user_id):
+            # both users must be inside at once, otherwise the barrier is broken
+            inside.wait()
+
+    threads = [threading.Thread(target=_turn, args=(u,)) for u in (first, second)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not inside.broken
@@ -0,0 +1,28 @@
+# coding: utf-8
+from seabattle import simulate
+from seabattle.game import Game
+
+
+def test_sprt_decisions():
+    sprt = simulate.SPRT(delta=0.1)
+    while sprt.decision() is None:
+        sprt.update(True)
+    assert sprt.decision() == 'H1'
+    assert sprt.games == sprt.wins
+
+    sprt = simulate.SPRT(delta=0.1)
+    while sprt.decision() is None:
+        sprt.update(False)
+    assert sprt.decision() == 'H0'
+
+
+def test_play_mirrored_pair():
+    results = simulate.play_mirrored_pair(Game, Game, size=5, ships=[2, 1])
+    assert len(results) == 2
+
+
+def test_evaluate_stops_at_max_games():
+    result = simulate.evaluate(Game, Game, delta=0.01, max_games=4, size=5, ships=[2, 1])
+    assert result['games'] == 4
+    assert result['wins'] + result['losses'] == 4
+    assert result['cpu_time'] >= 0
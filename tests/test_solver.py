@@ -0,0 +1,124 @@
+# coding: utf-8
+from seabattle import game as gm
+from seabattle import solver
+from seabattle import strategies
+
+import random
+import time
+
+import pytest
+
+
+def _field(size, cells):
+    field = [gm.EMPTY] * size ** 2
+    for index, value in cells.items():
+        field[index] = value
+    return field
+
+
+def test_placements_avoid_misses_and_edges():
+    field = _field(5, {0: gm.SHIP, 1: gm.MISS})
+    placements = solver.covering_placements(field, 5, frozenset([0]), [2])
+
+    assert sorted(sorted(cells) for _, cells, _ in placements[0]) == [[0, 5]]
+
+
+def test_samples_follow_remaining_fleet():
+    # two hits in a row, only a three cell ship is afloat
+    field = _field(10, {44: gm.SHIP, 45: gm.SHIP})
+    counts, samples = solver.sample_counts(field, 10, {44, 45}, [3], time.monotonic() + 0.05, seed=1)
+
+    assert samples > 0
+    assert set(counts) == {43, 46}
+
+
+def test_hits_of_one_ship_cannot_be_split():
+    field = _field(10, {44: gm.SHIP, 45: gm.SHIP})
+    counts, samples = solver.sample_counts(field, 10, {44, 45}, [1, 1], time.monotonic() + 0.01, seed=1)
+
+    assert samples == 0
+    assert counts == {}
+
+
+def test_samples_leave_room_for_ships_afloat():
+    # only the top row is open: a two cell ship over the hit leaves three cells for the four
+    field = [gm.MISS] * 36
+    field[:6] = [gm.SHIP] + [gm.EMPTY] * 5
+    counts, samples = solver.sample_counts(field, 6, {0}, [2, 4], time.monotonic() + 0.01, seed=1)
+
+    assert samples == 0
+    assert counts == {}
+
+    counts, samples = solver.sample_counts(field, 6, {0}, [2, 3], time.monotonic() + 0.01, seed=1)
+    assert samples > 0
+    assert set(counts) <= {1, 2}
+
+
+@pytest.fixture
+def target_game():
+    random.seed(0)
+    g = strategies.game_class('montecarlo')()
+    g.start_new_game(10, [gm.EMPTY] * 100, numbers=True)
+    g.strategy.budget = 0.01
+    return g
+
+
+def test_target_mode_shoots_next_to_hit(target_game):
+    target_game.last_shot_position = (5, 5)
+    target_game.handle_enemy_reply('hit')
+
+    assert target_game.next_shot_index in {target_game.calc_index(p) for p in [(4, 5), (6, 5), (5, 4), (5, 6)]}
+
+
+def test_target_mode_respects_deadline(target_game):
+    target_game.strategy.budget = 1.0
+    target_game.deadline = time.monotonic() + 0.02
+    target_game.last_shot_position = (5, 5)
+
+    started = time.monotonic()
+    target_game.handle_enemy_reply('hit')
+
+    assert time.monotonic() - started < 0.1
+    assert target_game.next_shot_index is not None
+
+
+def test_kill_updates_remaining_fleet(target_game):
+    for position, reply in (((5, 5), 'hit'), ((5, 6), 'kill')):
+        target_game.last_shot_position = position
+        target_game.handle_enemy_reply(reply)
+
+    assert target_game.strategy.sunk_ships == [2]
+    assert target_game.strategy.remaining_fleet(target_game) == [4, 3, 3, 2, 2, 1, 1, 1, 1]
+    assert not target_game.strategy.unsunk_hits(target_game)
+
+
+def test_plays_full_game():
+    random.seed(1)
+    target = gm.Game()
+    target.start_new_game(10)
+    shooter = strategies.game_class('montecarlo')()
+    shooter.start_new_game(10, [gm.EMPTY] * 100, numbers=True)
+    shooter.strategy.budget = 0.002
+
+    shots = 0
+    while not target.is_defeat():
+        position = shooter.convert_to_position(shooter.do_shot().replace(',', ''))
+        shooter.handle_enemy_reply(target.handle_enemy_shot(position))
+        shots += 1
+
+    assert shooter.is_victory()
+    assert shots <= 100
+
+
+def test_pool_is_started_once(monkeypatch):
+    monkeypatch.setattr(solver, 'SOLVER_PROCESSES', 1)
+    monkeypatch.setattr(solver, '_pool', None)
+    assert solver.get_pool() is None
+
+    pool = solver.start_pool()
+    try:
+        assert solver.start_pool() is pool
+        assert solver.get_pool() is pool
+        assert pool.apply(solver.sample_counts, ([gm.EMPTY] * 100, 10, {44}, [2], time.monotonic() + 0.01, 10, 1))[1] > 0
+    finally:
+        pool.terminate()
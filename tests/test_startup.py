@@ -0,0 +1,41 @@
+# coding: utf-8
+from seabattle import startup
+
+
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       204 |        204 |   seabattle
+import time:      2058 |       8941 |   logging
+import time:       574 |        574 |       seabattle.metrics
+import time:      9190 |      10536 |     seabattle.game
+import time:      5032 |     198832 | seabattle.api
+some other line
+"""
+
+
+def test_parse_importtime():
+    records = startup.parse_importtime(IMPORTTIME)
+
+    assert [r.module for r in records] == ['seabattle', 'logging', 'seabattle.metrics', 'seabattle.game', 'seabattle.api']
+    assert records[-1].cumulative == 0.198832
+    assert records[-1].depth == 0
+    assert records[2].depth == 3
+
+
+def test_report_by_package():
+    report = startup.report_by_package(startup.parse_importtime(IMPORTTIME))
+
+    assert report[0][0] == 'seabattle'
+    assert abs(report[0][1] - 0.015) < 1e-9
+    assert report[1] == ('logging', 0.002058)
+
+
+def test_service_import_is_light():
+    modules = {r.module for r in startup.measure_imports('seabattle.api')}
+
+    for heavy in ('rasa_nlu', 'spacy', 'tensorflow', 'transliterate'):
+        assert heavy not in modules
+
+
+def test_preload_and_warmup():
+    assert startup.preload() >= 0
+    assert startup.warmup() >= 0
@@ -0,0 +1,11 @@
+# coding: utf-8
+from seabattle import stats
+
+
+def test_percentile():
+    values = [5, 1, 4, 2, 3]
+
+    assert stats.percentile(values, 0) == 1
+    assert stats.percentile(values, 0.5) == 3
+    assert stats.percentile(values, 0.95) == 5
+    assert stats.percentile([7], 0.99) == 7
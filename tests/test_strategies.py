@@ -0,0 +1,91 @@
+# coding: utf-8
+from seabattle import game as gm
+from seabattle import solver
+from seabattle import strategies
+
+import os
+import pickle
+
+import pytest
+
+
+class RecordingStrategy(strategies.Strategy):
+    name = 'recording'
+
+    def reset(self, game):
+        self.replies = []
+
+    def choose_shot(self, game):
+        return game.get_line_index().empty[0]
+
+    def on_reply(self, game, message):
+        self.replies.append(message)
+
+
+def test_builtin_strategies_are_registered():
+    assert {'lines', 'random', 'montecarlo'} <= set(strategies.names())
+    assert strategies.get('montecarlo') is solver.MonteCarloStrategy
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        strategies.get('no such strategy')
+
+
+def test_game_delegates_to_strategy():
+    g = strategies.game_class('tests.test_strategies:RecordingStrategy')()
+    g.start_new_game(numbers=True)
+
+    assert g.do_shot() == '1, 1'
+    g.handle_enemy_reply('hit')
+    assert g.do_shot() == '2, 1'
+    g.handle_enemy_reply('kill')
+    assert g.do_shot() == '4, 1'
+    g.handle_enemy_reply('miss')
+
+    assert g.strategy.replies == ['hit', 'kill', 'miss']
+
+
+def test_strategy_is_kept_with_the_game():
+    g = gm.Game()
+    g.strategy_name = 'montecarlo'
+    g.start_new_game(numbers=True)
+    g.strategy.sunk_ships.append(2)
+
+    restored = pickle.loads(pickle.dumps(g))
+    assert isinstance(restored.strategy, solver.MonteCarloStrategy)
+    assert restored.strategy.sunk_ships == [2]
+
+
+def test_strategy_swapped_without_restart(tmpdir, monkeypatch):
+    path = tmpdir.join('strategy.txt')
+    monkeypatch.setattr(strategies, 'STRATEGY_FILE', str(path))
+
+    assert strategies.current_name() == strategies.DEFAULT_STRATEGY
+
+    path.write('random\n')
+    g = gm.Game()
+    g.start_new_game(numbers=True)
+    assert isinstance(g.strategy, strategies.RandomStrategy)
+
+    path.write('montecarlo')
+    os.utime(str(path), (1, 1))
+    assert strategies.current_name() == 'montecarlo'
+    # a game in progress keeps its strategy
+    g.do_shot()
+    assert isinstance(g.strategy, strategies.RandomStrategy)
+
+    path.write('broken')
+    os.utime(str(path), (2, 2))
+    assert strategies.current_name() == strategies.DEFAULT_STRATEGY
+
+
+@pytest.mark.parametrize('name', strategies.names())
+def test_standard_benchmark(name, monkeypatch):
+    monkeypatch.setattr(solver.MonteCarloStrategy, 'budget', 0.001)
+    result = strategies.benchmark(name, games=2)
+
+    assert result['games'] == 2
+    assert 0 <= result['win_rate'] <= 1
+    assert 20 <= result['mean_shots'] <= 100
+    assert result['shot_p95_us'] > 0
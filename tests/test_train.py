@@ -0,0 +1,33 @@
+# coding: utf-8
+from seabattle import nlu
+from seabattle import train
+
+
+def test_split_pipeline():
+    pipeline = [{'name': 'SpacyNLP'}, {'name': 'SpacyTokenizer'}, {'name': 'SpacyFeaturizer'},
+                {'name': 'SklearnIntentClassifier'}, {'name': 'CRFEntityExtractor', 'max_iterations': 50}]
+    parts = train.split_pipeline(pipeline)
+
+    assert [c['name'] for c in parts['intent']] == ['SpacyNLP', 'SpacyTokenizer', 'SpacyFeaturizer',
+                                                    'SklearnIntentClassifier']
+    assert [c['name'] for c in parts['entity']] == ['SpacyNLP', 'SpacyTokenizer', 'CRFEntityExtractor']
+
+
+def test_entity_edit_only_changes_entity_view():
+    examples = [{'text': 'я хожу 1 2', 'intent': 'miss',
+                 'entities': [{'start': 7, 'end': 10, 'value': '1 2', 'entity': 'hit_entity'}]}]
+    edited = [dict(examples[0], entities=[{'start': 7, 'end': 10, 'value': '1 2', 'entity': 'opponent_entity'}])]
+
+    before = train.data_views(examples)
+    after = train.data_views(edited)
+
+    assert train.content_hash(before['intent']) == train.content_hash(after['intent'])
+    assert train.content_hash(before['entity']) != train.content_hash(after['entity'])
+
+
+def test_unchanged_ngram_model_is_not_retrained(tmpdir):
+    path = str(tmpdir.join('ngram_model.bin'))
+
+    assert train.train_ngram(nlu.INTENTS_PATH, path)[0] == 'ngram'
+    assert train.train_ngram(nlu.INTENTS_PATH, path) is None
+    assert train.train_ngram(nlu.INTENTS_PATH, path, force=True)[0] == 'ngram'